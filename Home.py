@@ -27,19 +27,27 @@ st.markdown(
 
     - Company View:
         - Quantity of orders per day and per week;
+        - 7 and 28-day moving averages of the orders per day;
         - How the orders behave in different traffic and city type conditions;
         - Geolocation for the median points of traffic in each city.
     
     - Delivery View:
         - General information about the deliverymen;
         - Average rating by vehicle condition, traffic density, type of order and weather conditions;
-        - The fastest and slowest deliverymen by type of city.
+        - The fastest and slowest deliverymen by type of city;
+        - Moving average of the rating by city.
+    
+    - Courier View:
+        - Orders of a single deliveryman;
+        - Rating trend over time;
+        - Delivery time by city and traffic.
     
     - Restaurants View:
         - General information about delivery time;
         - Average distance and time by type of city;
         - Average time by city and type of order;
-        - Delivery time by city and traffic.
+        - Delivery time by city and traffic;
+        - Moving average of the delivery time by city.
 
     - Observations:
         - There are filter options in three views above, like date interval, traffic conditions and city type to select. 
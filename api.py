@@ -0,0 +1,328 @@
+# Aggregates API
+
+# Serves the dashboard metrics as JSON, computed with the same loading,
+# filtering and aggregation functions used by the pages.
+#
+# Usage: python api.py --port 8600
+#
+#   GET /metrics                    list of the metrics and their options
+#   GET /metrics/<metric>?date=2022-03-01&traffic=Low,Jam&city=Urban&<options>
+#   GET /export?format=csv&columns=ID,City,Time_taken(min)&date=2022-03-01&traffic=Low,Jam&city=Urban
+#
+# Metric responses are cached by dataset version and normalized filters, carry an ETag
+# (answered with 304 when it matches If-None-Match) and are gzipped on request.
+# Exports are streamed in chunks as they are read, without being cached.
+
+# Importing libraries
+
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import threading
+import traceback
+
+from collections            import  OrderedDict
+from http.server            import  BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse           import  parse_qs, urlsplit
+
+from food_data              import  ensure_partitions, load_filtered, load_id_lookup, dataset_version, read_snapshot
+from food_data              import  METRICS, metric_options, compute_metric, metric_records, normalize_filters
+from food_data              import  export_orders
+
+# ----------------------
+# Functions
+# ----------------------
+
+def normalize_query(directory, metric, query):
+    """
+    This function validates the query parameters of a metric and returns them in a
+    canonical form, so equivalent requests share the same cache entry and ETag.
+
+    Input: partition directory, metric name, dictionary {parameter: value}
+    Output: dictionary of filters, dictionary of options
+    """
+
+    query = dict(query)
+    filters = normalize_filters(directory, query.pop('date', None), query.pop('traffic', None), query.pop('city', None))
+
+    return filters, metric_options(metric, query)
+
+def to_json(metric, filters, options, version, result):
+    """
+    This function serializes the result of a metric with its filters and the dataset version.
+    """
+
+    # NaN is not valid JSON, metric_records already turns missing values into null
+    return json.dumps({'metric': metric, 'filters': filters, 'options': options,
+                       'version': version, 'data': metric_records(result)}, allow_nan=False).encode('utf-8')
+
+def accepts_gzip(accept_encoding):
+    """
+    This function checks that an Accept-Encoding header accepts gzip: gzip, or *
+    when gzip is not listed, with a q-value above 0 (e.g. 'gzip;q=0' refuses it).
+
+    Input: Accept-Encoding header
+    Output: bool
+    """
+
+    qualities = {}
+
+    for token in accept_encoding.split(','):
+        coding, *parameters = [part.strip() for part in token.split(';')]
+        if not coding:
+            continue
+
+        quality = 1.0
+        for parameter in parameters:
+            name, _, value = parameter.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        qualities[coding.lower()] = quality
+
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+class MetricsCache:
+    """
+    Computes and caches the metric responses of a partitioned dataset.
+
+    The dataset version is the hash of the partition manifest, checked on every
+    request, so rebuilding the partitions invalidates the cache. The ETag of a
+    response depends only on the version and the normalized query, so a matching
+    If-None-Match is answered without computing the metric. Cache misses are served
+    from the batch export snapshots when they cover the filters.
+    """
+
+    def __init__(self, path, directory, snapshots='snapshots', max_entries=256):
+        self.path = path
+        self.directory = directory
+        self.snapshots = snapshots
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.manifest_stat = None
+        self.version = None
+        self.id_lookup = None
+
+    def refresh(self):
+        """
+        This function reloads the dataset version and the lookup tables when the manifest changes.
+        """
+
+        ensure_partitions(self.path, self.directory)
+        manifest = os.path.join(self.directory, 'manifest.csv')
+        stat = os.stat(manifest)
+
+        with self.lock:
+            if (stat.st_mtime_ns, stat.st_size) != self.manifest_stat:
+                self.version = dataset_version(self.directory)
+                self.id_lookup = load_id_lookup(self.directory, ['Delivery_person_ID'])
+                self.entries.clear()
+                self.manifest_stat = (stat.st_mtime_ns, stat.st_size)
+
+            return self.version, self.id_lookup
+
+    def etag(self, version, metric, filters, options):
+        """
+        This function builds the ETag of a response from the version and the normalized query.
+        """
+
+        key = json.dumps([version, metric, filters, options], sort_keys=True)
+
+        return '"' + hashlib.sha1(key.encode('utf-8')).hexdigest() + '"'
+
+    def get(self, metric, filters, options):
+        """
+        This function returns the ETag, the JSON body and the gzipped body of a metric,
+        computing them only when they are not cached.
+        """
+
+        version, id_lookup = self.refresh()
+        etag = self.etag(version, metric, filters, options)
+
+        with self.lock:
+            if etag in self.entries:
+                self.entries.move_to_end(etag)
+                return self.entries[etag]
+
+        snapshot = read_snapshot(self.snapshots, self.directory, filters['date'], filters['traffic'], filters['city'])
+        df = load_filtered(self.directory, filters['date'], filters['traffic'], filters['city']) if snapshot is None else None
+        result = compute_metric(metric, df, id_lookup, snapshot, **options)
+
+        body = to_json(metric, filters, options, version, result)
+        entry = (etag, body, gzip.compress(body))
+
+        with self.lock:
+            self.entries[etag] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        return entry
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """
+    Answers the GET requests of the metrics API.
+    """
+
+    cache = None
+
+    def do_GET(self):
+        """
+        This function answers a request, with a JSON error 500 when it fails
+        unexpectedly. A failure after the response has started (e.g. during an
+        export) can only close the connection.
+        """
+
+        self.response_started = False
+
+        try:
+            return self.route()
+        except Exception:
+            self.log_error('%s', traceback.format_exc())
+
+            if self.response_started:
+                self.close_connection = True
+                return None
+
+            return self.send_error_json(500, 'internal error')
+
+    def send_response(self, code, message=None):
+        self.response_started = True
+        super().send_response(code, message)
+
+    def route(self):
+        """
+        This function dispatches a request to the catalog, a metric or the export.
+        """
+
+        url = urlsplit(self.path)
+        parts = [part for part in url.path.split('/') if part]
+
+        # Blank values are kept, e.g. columns= selects no columns instead of all of them
+        query = {name: values[-1] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+
+        if parts == ['metrics']:
+            catalog = {metric: settings['options'] for metric, settings in METRICS.items()}
+            return self.send_body(200, json.dumps(catalog).encode('utf-8'))
+
+        if parts == ['export']:
+            return self.send_export(query)
+
+        if len(parts) != 2 or parts[0] != 'metrics' or parts[1] not in METRICS:
+            return self.send_error_json(404, 'unknown metric')
+
+        version, _ = self.cache.refresh()
+
+        try:
+            filters, options = normalize_query(self.cache.directory, parts[1], query)
+        except ValueError as error:
+            return self.send_error_json(400, str(error))
+
+        etag = self.cache.etag(version, parts[1], filters, options)
+
+        if etag in [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]:
+            # Same caching headers as the 200 response
+            self.send_response(304)
+            self.send_header('Vary', 'Accept-Encoding')
+            self.send_header('Cache-Control', 'no-cache')
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return None
+
+        etag, body, gzip_body = self.cache.get(parts[1], filters, options)
+
+        return self.send_body(200, body, etag, gzip_body)
+
+    def send_export(self, query):
+        """
+        This function streams the filtered orders as CSV or Parquet, writing each
+        chunk as soon as it is encoded. The end of the file is the end of the connection.
+        """
+
+        self.cache.refresh()
+        query = dict(query)
+        file_format = query.pop('format', 'csv')
+        columns = query.pop('columns', None)
+
+        try:
+            filters = normalize_filters(self.cache.directory, query.pop('date', None),
+                                        query.pop('traffic', None), query.pop('city', None))
+            if query:
+                raise ValueError(f'unknown parameters: {", ".join(sorted(query))}')
+
+            chunks = export_orders(self.cache.directory, filters['date'], filters['traffic'], filters['city'],
+                                   None if columns is None else [column for column in columns.split(',') if column],
+                                   file_format)
+
+            # The first chunk validates the columns and the format before the headers are sent
+            first_chunk = next(chunks)
+        except ValueError as error:
+            return self.send_error_json(400, str(error))
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv' if file_format == 'csv' else 'application/vnd.apache.parquet')
+        self.send_header('Content-Disposition', f'attachment; filename="orders.{file_format}"')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        self.wfile.write(first_chunk)
+        for chunk in chunks:
+            self.wfile.write(chunk)
+
+        return None
+
+    def send_body(self, status, body, etag=None, gzip_body=None):
+        """
+        This function sends a JSON body, gzipped when the client accepts it.
+        """
+
+        use_gzip = gzip_body is not None and accepts_gzip(self.headers.get('Accept-Encoding', ''))
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Cache-Control', 'no-cache')
+        if etag is not None:
+            self.send_header('ETag', etag)
+        if use_gzip:
+            body = gzip_body
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+        return None
+
+    def send_error_json(self, status, message):
+        """
+        This function sends an error message as JSON.
+        """
+
+        return self.send_body(status, json.dumps({'error': message}).encode('utf-8'))
+
+# ----------------------
+# Server
+# ----------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='JSON API of the dashboard metrics.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8600)
+    parser.add_argument('--csv', default='train.csv', help='raw dataset, used to build missing partitions')
+    parser.add_argument('--partitions', default='partitions')
+    parser.add_argument('--snapshots', default='snapshots', help='batch export snapshots')
+    parser.add_argument('--cache-entries', type=int, default=256)
+    args = parser.parse_args()
+
+    MetricsHandler.cache = MetricsCache(args.csv, args.partitions, args.snapshots, args.cache_entries)
+    MetricsHandler.cache.refresh()
+
+    server = ThreadingHTTPServer((args.host, args.port), MetricsHandler)
+    print(f'Serving the metrics on http://{args.host}:{args.port}/metrics')
+    server.serve_forever()
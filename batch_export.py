@@ -0,0 +1,200 @@
+# Batch Export
+
+# Precomputes every metric of the dashboard pages for a configured set of
+# filter combinations, in a process pool, and writes a static JSON and HTML
+# snapshot of each one. The pages and the API serve a snapshot directly when
+# the filter state matches it and the dataset version has not changed.
+#
+# Usage: python batch_export.py --processes 4
+#        python batch_export.py --config combinations.json
+#
+# A configuration file is a list of filter states, e.g.
+#   [{"city": ["Urban"]}, {"traffic": ["Jam"], "date": "2022-03-01"}]
+
+# Importing libraries
+
+import argparse
+import json
+import os
+import shutil
+
+import pandas               as pd
+import plotly.express       as px
+
+from concurrent.futures     import  ProcessPoolExecutor
+
+from food_data              import  ensure_partitions, load_filtered, load_id_lookup, dataset_version
+from food_data              import  TRAFFIC_OPTIONS, CITY_OPTIONS, metric_entries, metric_entry, compute_metric
+from food_data              import  metric_records, normalize_filters, snapshot_key, snapshot_metrics
+
+# ----------------------
+# Settings
+# ----------------------
+
+# All cities, each city alone and each traffic density alone
+DEFAULT_COMBINATIONS = ([{}]
+                        + [{'city': [city]} for city in CITY_OPTIONS]
+                        + [{'traffic': [traffic]} for traffic in TRAFFIC_OPTIONS])
+
+# Metrics drawn as charts in the HTML report, the others are displayed as tables
+REPORT_CHARTS = {
+    'orders_per_day?resolution=Auto':   lambda df: px.bar(df, x='Order_Date', y='ID',
+                                                          labels={'Order_Date': 'Date', 'ID': 'Quantity'}),
+    'orders_per_week':                  lambda df: px.line(df, x='Order_Date', y='ID',
+                                                           labels={'Order_Date': 'Week', 'ID': 'Quantity'}),
+    'traffic_share':                    lambda df: px.bar(df, x='Road_traffic_density', y='perc_ID',
+                                                          labels={'Road_traffic_density': 'Traffic Density',
+                                                                  'perc_ID': 'Percentage'}),
+    'city_traffic_orders':              lambda df: px.scatter(df, x='City', y='Road_traffic_density', size='ID', color='City',
+                                                              labels={'Road_traffic_density': 'Traffic Density'}),
+    'distance_by_city':                 lambda df: px.bar(df, x='City', y='distance'),
+}
+
+# ----------------------
+# Functions
+# ----------------------
+
+def write_replace(path, text):
+    """
+    This function writes a file next to its destination and renames it into place,
+    so the pages and the API reading it never see a partially written file.
+    """
+
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        file.write(text)
+    os.replace(path + '.tmp', path)
+
+    return None
+
+def report_html(filters, results):
+    """
+    This function builds a static HTML page with the charts and tables of a snapshot.
+
+    Input: normalized filters, dictionary {metric entry: Dataframe or dictionary}
+    Output: string
+    """
+
+    parts = ['<html><head><meta charset="utf-8"><title>Food Delivery Company</title></head><body>',
+             f'<h1>Food Delivery Company</h1><p>Filters: {json.dumps(filters)}</p>']
+
+    for entry, result in results.items():
+        parts.append(f'<h2>{entry}</h2>')
+
+        if entry in REPORT_CHARTS:
+            parts.append(REPORT_CHARTS[entry](result).to_html(full_html=False, include_plotlyjs='cdn'))
+        elif isinstance(result, pd.DataFrame):
+            parts.append(result.to_html(index=False))
+        else:
+            parts.append(pd.Series(result).to_frame('value').to_html())
+
+    parts.append('</body></html>')
+
+    return '\n'.join(parts)
+
+def check_snapshot(results, records, columns):
+    """
+    This function checks that the stored records and columns rebuild tables with
+    the same columns as the computed metrics, including the empty tables of a
+    filter state without any order, which the pages would fail to draw otherwise.
+
+    Input: dictionary {metric entry: Dataframe or dictionary}, dictionary {metric entry: records},
+           dictionary {metric entry: list of columns}
+    Output: None
+    """
+
+    snapshot = snapshot_metrics(records, columns)
+
+    mismatched = [entry for entry, result in results.items()
+                  if isinstance(result, pd.DataFrame) and list(snapshot[entry].columns) != list(result.columns)]
+    if mismatched:
+        raise ValueError(f'snapshot tables with other columns than the metrics: {", ".join(mismatched)}')
+
+    return None
+
+def export_snapshot(directory, partitions, folder, filters):
+    """
+    This function computes every metric with every option for a filter state
+    and writes metrics.json and report.html into directory/folder.
+
+    Input: snapshot directory, partition directory, snapshot folder, normalized filters
+    Output: snapshot folder
+    """
+
+    df = load_filtered(partitions, filters['date'], filters['traffic'], filters['city'])
+    id_lookup = load_id_lookup(partitions, ['Delivery_person_ID'])
+
+    results = {metric_entry(metric, options): compute_metric(metric, df, id_lookup, **options)
+               for metric, options in metric_entries()}
+
+    records = {entry: metric_records(result) for entry, result in results.items()}
+    columns = {entry: list(result.columns) for entry, result in results.items() if isinstance(result, pd.DataFrame)}
+    check_snapshot(results, records, columns)
+
+    path = os.path.join(directory, folder)
+    os.makedirs(path, exist_ok=True)
+
+    # Folders are named by dataset version, so a new export of the same version replaces files being read
+    write_replace(os.path.join(path, 'metrics.json'),
+                  json.dumps({'filters': filters, 'metrics': records, 'columns': columns}))
+    write_replace(os.path.join(path, 'report.html'), report_html(filters, results))
+
+    return folder
+
+def export_snapshots(combinations, directory='snapshots', partitions='partitions', processes=None):
+    """
+    This function exports the snapshots of the filter combinations in parallel and
+    writes the index that maps each normalized filter state to its folder. The index
+    is written last and renamed into place, so readers never see a partial export.
+
+    Input: list of filter states, snapshot directory, partition directory, number of processes
+    Output: dictionary (index)
+    """
+
+    version = dataset_version(partitions)
+    filters = [normalize_filters(partitions, combination.get('date'), combination.get('traffic'), combination.get('city'))
+               for combination in combinations]
+
+    # Equivalent combinations share a single snapshot
+    filters = list({snapshot_key(state): state for state in filters}.values())
+    folders = [f'{version}-{i:03d}' for i in range(len(filters))]
+
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        list(executor.map(export_snapshot, [directory] * len(filters), [partitions] * len(filters), folders, filters))
+
+    index = {'version': version,
+             'snapshots': {snapshot_key(state): folder for state, folder in zip(filters, folders)}}
+
+    write_replace(os.path.join(directory, 'index.json'), json.dumps(index, indent=1))
+
+    # Snapshots of previous dataset versions are no longer referenced
+    for folder in os.listdir(directory):
+        if os.path.isdir(os.path.join(directory, folder)) and not folder.startswith(version):
+            shutil.rmtree(os.path.join(directory, folder))
+
+    return index
+
+# ----------------------
+# Batch export
+# ----------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Precompute the dashboard metrics for a set of filter combinations.')
+    parser.add_argument('--csv', default='train.csv', help='raw dataset, used to build missing partitions')
+    parser.add_argument('--partitions', default='partitions')
+    parser.add_argument('--snapshots', default='snapshots')
+    parser.add_argument('--config', help='JSON list of filter states (default: all, each city, each traffic density)')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    combinations = DEFAULT_COMBINATIONS
+    if args.config is not None:
+        with open(args.config) as file:
+            combinations = json.load(file)
+
+    ensure_partitions(args.csv, args.partitions)
+    os.makedirs(args.snapshots, exist_ok=True)
+
+    index = export_snapshots(combinations, args.snapshots, args.partitions, args.processes)
+
+    print(f'{len(index["snapshots"])} snapshot(s) of dataset version {index["version"]} in {args.snapshots}')
@@ -0,0 +1,1118 @@
+# Food Data
+
+# Loading and cleaning functions shared by the dashboard pages
+
+# Importing libraries
+
+import contextlib
+import hashlib
+import io
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import pandas               as pd
+import numpy                as np
+import pyarrow              as pa
+import pyarrow.parquet      as pq
+
+from haversine              import  haversine_vector
+from urllib.parse           import  urlencode
+
+# ----------------------
+# Settings
+# ----------------------
+
+# Compact dtype of each numeric column after cleaning. Coordinates keep ~1 m of
+# precision as float32, ratings have a single decimal and ages, vehicle conditions,
+# multiple deliveries and minutes are small integers.
+
+DTYPE_RULES = {
+    'Delivery_person_Age':          'int8',
+    'Delivery_person_Ratings':      'float32',
+    'Restaurant_latitude':          'float32',
+    'Restaurant_longitude':         'float32',
+    'Delivery_location_latitude':   'float32',
+    'Delivery_location_longitude':  'float32',
+    'Vehicle_condition':            'int8',
+    'multiple_deliveries':          'int8',
+    'Time_taken(min)':              'int16',
+}
+
+# Time-series charts are rolled up from day to week, month, quarter and year
+# until the number of points fits in the chart.
+
+ROLLUP_FREQUENCIES = ['D', 'W', 'M', 'Q', 'Y']
+
+# Maximum number of points sent to the time-series charts
+CHART_MAX_POINTS = 200
+
+RESOLUTIONS = {'Day': 'D', 'Week': 'W', 'Month': 'M'}
+
+# Values of the traffic and city filters of the pages
+TRAFFIC_OPTIONS = ['Low', 'Medium', 'High', 'Jam']
+CITY_OPTIONS    = ['Metropolitian', 'Urban', 'Semi-Urban']
+
+# Address of the API (api.py) that streams the exports linked by the pages,
+# e.g. http://localhost:8600. Without it, the pages do not offer the export.
+EXPORT_API_URL = os.environ.get('FOOD_API_URL')
+
+# Rows read, filtered and written at a time by the exports
+EXPORT_CHUNK_ROWS = 50000
+
+# Seconds after which the partition build lock of a crashed process is removed
+BUILD_LOCK_TIMEOUT = 600
+
+# ----------------------
+# Functions
+# ----------------------
+
+def clean_code(df_raw):
+    """
+    The purpose of this function is cleaning the Dataframe
+
+    Types of cleaning:
+     1. Removal of 'NaN ' string data and its removal from Dataframe
+     2. Conversion of text columns to number
+     3. Conversion of text columns to datetime
+     4. Time_taken(min) column split and text to number conversion
+     5. Removing spaces inside strings/text/object
+
+    Delivery_person_ID is stripped as well, so the courier labels displayed by the
+    pages no longer carry the trailing space of the raw file (e.g. 'INDORES13DEL02').
+
+    Input: Dataframe
+    Output: Dataframe
+    """
+
+    # 1. Removal of 'NaN ' string data and its removal from Dataframe
+
+    df_clean = df_raw.replace('NaN ', np.nan).dropna()
+
+    # 2. Conversion of text columns to number
+
+    df_clean['Delivery_person_Age']         = df_clean['Delivery_person_Age'].astype(int)
+    df_clean['Delivery_person_Ratings']     = df_clean['Delivery_person_Ratings'].astype(float)
+    df_clean['multiple_deliveries']         = df_clean['multiple_deliveries'].astype(int)
+
+    # 3. Conversion of text columns to datetime
+
+    df_clean['Order_Date'] = pd.to_datetime(df_clean['Order_Date'], format = '%d-%m-%Y')
+
+    # 4. Time_taken(min) column split and text to number conversion
+
+    df_clean['Time_taken(min)'] = df_clean['Time_taken(min)'].apply(lambda x: x.split('(min) ')[1])
+    df_clean['Time_taken(min)'] = df_clean['Time_taken(min)'].astype(int)
+
+    # 5. Removing spaces inside strings/text/object
+
+    df_clean.loc[:, 'ID']                   = df_clean.loc[:, 'ID'].str.strip()
+    df_clean.loc[:, 'Delivery_person_ID']   = df_clean.loc[:, 'Delivery_person_ID'].str.strip()
+    df_clean.loc[:, 'Road_traffic_density'] = df_clean.loc[:, 'Road_traffic_density'].str.strip()
+    df_clean.loc[:, 'Type_of_order']        = df_clean.loc[:, 'Type_of_order'].str.strip()
+    df_clean.loc[:, 'Type_of_vehicle']      = df_clean.loc[:, 'Type_of_vehicle'].str.strip()
+    df_clean.loc[:, 'City']                 = df_clean.loc[:, 'City'].str.strip()
+    df_clean.loc[:, 'Festival']             = df_clean.loc[:, 'Festival'].str.strip()
+
+    return df_clean
+
+def encode_ids(df_clean, columns=('ID', 'Delivery_person_ID')):
+    """
+    This function dictionary-encodes the identifier columns into int32 codes,
+    so grouping and distinct counting run on integer arrays instead of strings.
+
+    The reverse lookup table of each column maps a code back to its original
+    label and is meant to be used only when displaying results.
+
+    Input: Dataframe, identifier columns
+    Output: Dataframe, dictionary {column: Index of labels}
+    """
+
+    df_encoded = df_clean.copy()
+    id_lookup = {}
+
+    for column in columns:
+        codes, labels = pd.factorize(df_encoded[column])
+        df_encoded[column] = codes.astype(np.int32)
+        id_lookup[column] = labels
+
+    return df_encoded, id_lookup
+
+def decode_ids(df, id_lookup, column):
+    """
+    This function translates the int32 codes of an identifier column back
+    to their original labels, for display only.
+
+    Input: Dataframe, reverse lookup tables, identifier column
+    Output: Dataframe
+    """
+
+    df_decoded = df.copy()
+    df_decoded[column] = id_lookup[column].take(df_decoded[column].to_numpy())
+
+    return df_decoded
+
+def optimize_dtypes(df, rules=DTYPE_RULES):
+    """
+    This function downcasts the numeric columns to the compact dtypes in rules.
+    Integer columns are checked against the range of their new dtype, so a value
+    that does not fit raises an error instead of silently wrapping around.
+
+    Input: Dataframe, dictionary {column: dtype}
+    Output: Dataframe
+    """
+
+    df_compact = df.copy()
+
+    for column, dtype in rules.items():
+        if np.issubdtype(np.dtype(dtype), np.integer):
+            limits = np.iinfo(dtype)
+            if df_compact[column].min() < limits.min or df_compact[column].max() > limits.max:
+                raise ValueError(f'{column} does not fit in {dtype}')
+
+        df_compact[column] = df_compact[column].astype(dtype)
+
+    return df_compact
+
+def memory_report(df_before, df_after):
+    """
+    This function compares the memory used by each column before and after
+    the dtype optimization, with a total row at the bottom.
+
+    Input: Dataframe before, Dataframe after
+    Output: Dataframe
+    """
+
+    df_aux = pd.DataFrame({'dtype_before': df_before.dtypes.astype(str),
+                           'dtype_after':  df_after.dtypes.astype(str),
+                           'mb_before':    df_before.memory_usage(index=False, deep=True) / 2**20,
+                           'mb_after':     df_after.memory_usage(index=False, deep=True) / 2**20})
+
+    df_aux.loc['Total', ['mb_before', 'mb_after']] = df_aux[['mb_before', 'mb_after']].sum()
+    df_aux[['dtype_before', 'dtype_after']] = df_aux[['dtype_before', 'dtype_after']].fillna('')
+    df_aux['reduction'] = 100 * ( 1 - df_aux['mb_after'] / df_aux['mb_before'] )
+
+    return np.round(df_aux, 2)
+
+def page_aggregates(df):
+    """
+    This function computes the aggregates displayed on the dashboard pages,
+    used to compare the 64-bit dataset with the compact one.
+
+    Input: Dataframe
+    Output: dictionary {metric name: Series}
+    """
+
+    results = {}
+
+    for column in ['Vehicle_condition', 'Type_of_order', 'Road_traffic_density', 'Weatherconditions']:
+        results[f'rating by {column}'] = rating_stats(df, column).set_index(column).stack()
+
+    for columns in [['Festival'], ['City'], ['City', 'Type_of_order'], ['City', 'Road_traffic_density']]:
+        results[f'time by {", ".join(columns)}'] = time_stats(df, columns).set_index(columns).stack()
+
+    results['deliverymen summary'] = pd.Series(deliverymen_summary(df))
+    results['time by courier'] = df.groupby(['City', 'Delivery_person_ID'])['Time_taken(min)'].mean()
+    results['location by city and traffic'] = (location_medians(df)
+                                               .set_index(['City', 'Road_traffic_density']).stack())
+    results['distance by city'] = distance_by_city(df).set_index('City')['distance']
+
+    return results
+
+def check_accuracy(df_reference, df_compact, tolerance=1e-3):
+    """
+    This function checks that the aggregates displayed on the pages are the same,
+    within tolerance, for the 64-bit dataset and the compact one.
+
+    Input: reference Dataframe, compact Dataframe, maximum absolute difference
+    Output: Dataframe with the maximum difference of each metric
+    """
+
+    results_reference = page_aggregates(df_reference)
+    results_compact = page_aggregates(df_compact)
+
+    rows = []
+    for metric, reference in results_reference.items():
+        difference = (results_compact[metric].astype(np.float64) - reference.astype(np.float64)).abs().max()
+        rows.append({'metric': metric, 'max_abs_diff': difference, 'ok': difference <= tolerance})
+
+    return pd.DataFrame(rows)
+
+def load_dataset(path='train.csv'):
+    """
+    This function reads the raw csv file, cleans it, encodes its identifiers
+    and downcasts its numeric columns.
+
+    Input: csv path
+    Output: Dataframe, reverse lookup tables of the identifier columns
+    """
+
+    df_raw      = pd.read_csv(path)
+    df_clean    = clean_code(df_raw)
+    df_clean, id_lookup = encode_ids(df_clean)
+
+    return optimize_dtypes(df_clean), id_lookup
+
+def build_courier_index(df):
+    """
+    This function sorts the rows by courier code and builds the offsets of each
+    courier group, so the orders of a courier are a contiguous slice of the
+    sorted Dataframe instead of a boolean scan of the whole dataset.
+
+    The orders of the courier with code c are the rows offsets[c]:offsets[c + 1].
+
+    Input: Dataframe with encoded Delivery_person_ID
+    Output: sorted Dataframe, numpy array of offsets
+    """
+
+    codes = df['Delivery_person_ID'].to_numpy()
+    order = np.argsort(codes, kind='stable')
+
+    df_sorted = df.iloc[order].reset_index(drop=True)
+    offsets = np.zeros(codes.max() + 2 if len(codes) else 1, dtype=np.int64)
+    np.cumsum(np.bincount(codes), out=offsets[1:])
+
+    return df_sorted, offsets
+
+def courier_orders(df_sorted, offsets, id_lookup, courier):
+    """
+    This function returns the orders of a single courier from the prebuilt index.
+
+    Input: sorted Dataframe, offsets, reverse lookup tables, courier label
+    Output: Dataframe (empty if the courier is unknown)
+    """
+
+    labels = id_lookup['Delivery_person_ID']
+
+    if courier not in labels:
+        return df_sorted.iloc[0:0]
+
+    code = labels.get_loc(courier)
+
+    return df_sorted.iloc[offsets[code]:offsets[code + 1]]
+
+def write_partitions(df, id_lookup, directory='partitions', freq='D', by_city=True, source=None):
+    """
+    This function stores the cleaned dataset as one parquet file per period of
+    Order_Date (and per city, when by_city is True), together with a manifest
+    holding the rows and the min/max statistics of each partition and the
+    reverse lookup tables of the identifier columns. The source statistics,
+    when given, are repeated on every row of the manifest.
+
+    Layout:
+     directory/date=<period start>/city=<city>/part.parquet
+     directory/manifest.csv
+     directory/id_lookup/<column>.parquet
+
+    Input: Dataframe, reverse lookup tables, output directory, pandas period frequency, city split,
+           dictionary {column: value} (source_stats)
+    Output: Dataframe (manifest)
+    """
+
+    keys = [df['Order_Date'].dt.to_period(freq).dt.start_time.rename('period')]
+    if by_city:
+        keys.append(df['City'])
+
+    rows = []
+    for key, df_part in df.groupby(keys, sort=True):
+        key = key if isinstance(key, tuple) else (key,)
+        folder = os.path.join(directory, f'date={key[0]:%Y-%m-%d}')
+        if by_city:
+            folder = os.path.join(folder, f'city={key[1]}')
+
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, 'part.parquet')
+        df_part.to_parquet(path, index=False)
+
+        rows.append({'path':            os.path.relpath(path, directory),
+                     'city':            key[1] if by_city else '',
+                     'rows':            len(df_part),
+                     'min_date':        df_part['Order_Date'].min(),
+                     'max_date':        df_part['Order_Date'].max(),
+                     'min_time_taken':  df_part['Time_taken(min)'].min(),
+                     'max_time_taken':  df_part['Time_taken(min)'].max()})
+
+    os.makedirs(os.path.join(directory, 'id_lookup'), exist_ok=True)
+    for column, labels in id_lookup.items():
+        pd.DataFrame({column: labels}).to_parquet(os.path.join(directory, 'id_lookup', f'{column}.parquet'))
+
+    # The manifest is written last and renamed into place, so readers never see a partial dataset
+    manifest = pd.DataFrame(rows)
+    for column, value in (source or {}).items():
+        manifest[column] = value
+    manifest.to_csv(os.path.join(directory, 'manifest.csv.tmp'), index=False)
+    os.replace(os.path.join(directory, 'manifest.csv.tmp'), os.path.join(directory, 'manifest.csv'))
+
+    return manifest
+
+def source_stats(path):
+    """
+    This function identifies the contents of the raw csv file by its size and modification time.
+
+    Input: csv path
+    Output: dictionary {'source_size', 'source_mtime_ns'}
+    """
+
+    stat = os.stat(path)
+
+    return {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+def partitions_current(path, directory):
+    """
+    This function checks that the partitioned dataset exists and was built from
+    the current raw csv file. Without the csv file, existing partitions are kept.
+
+    Input: csv path, partition directory
+    Output: bool
+    """
+
+    manifest_path = os.path.join(directory, 'manifest.csv')
+
+    if not os.path.exists(manifest_path):
+        return False
+    if not os.path.exists(path):
+        return True
+
+    manifest = pd.read_csv(manifest_path, nrows=1)
+    source = source_stats(path)
+
+    return (not manifest.empty
+            and all(column in manifest.columns and manifest[column].iloc[0] == value
+                    for column, value in source.items()))
+
+@contextlib.contextmanager
+def build_lock(path, timeout=BUILD_LOCK_TIMEOUT):
+    """
+    This function holds a lock file shared by the threads and processes that
+    build the same partition directory. A lock older than timeout seconds was
+    left by a crashed build and is removed.
+
+    Input: lock file path, seconds
+    """
+
+    while True:
+        try:
+            lock = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(path) > timeout:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+            time.sleep(0.1)
+
+    try:
+        yield
+    finally:
+        os.close(lock)
+        os.remove(path)
+
+def ensure_partitions(path='train.csv', directory='partitions', freq='D', by_city=True):
+    """
+    This function builds the partitioned dataset from the raw csv file when the
+    partition directory does not exist yet or was built from a previous version
+    of the csv file (different size or modification time).
+
+    The build holds a lock, so concurrent sessions build the dataset only once,
+    and is written into a temporary directory renamed into place when complete,
+    so readers never see a partial dataset.
+
+    Input: csv path, partition directory, pandas period frequency, city split
+    Output: partition directory
+    """
+
+    if partitions_current(path, directory):
+        return directory
+
+    directory = directory.rstrip('/\\')
+    parent = os.path.dirname(os.path.abspath(directory))
+
+    with build_lock(directory + '.lock'):
+        # Another session may have built the partitions while this one was waiting
+        if partitions_current(path, directory):
+            return directory
+
+        source = source_stats(path)
+        df_clean, id_lookup = load_dataset(path)
+
+        build = tempfile.mkdtemp(prefix=os.path.basename(directory) + '.build-', dir=parent)
+        write_partitions(df_clean, id_lookup, build, freq, by_city, source)
+
+        # The previous partitions are moved aside and removed once the new ones are in place
+        previous = build + '.previous'
+        if os.path.exists(directory):
+            os.rename(directory, previous)
+        os.rename(build, directory)
+        shutil.rmtree(previous, ignore_errors=True)
+
+    return directory
+
+def prune_partitions(directory, date_max=None, cities=None, date_min=None):
+    """
+    This function selects, from the manifest statistics, the partitions
+    that may hold rows inside the date interval and the selected cities.
+
+    Input: partition directory, last date, list of cities, first date
+    Output: Dataframe (manifest rows of the selected partitions)
+    """
+
+    manifest = pd.read_csv(os.path.join(directory, 'manifest.csv'),
+                           parse_dates=['min_date', 'max_date'], keep_default_na=False)
+    selected = np.ones(len(manifest), dtype=bool)
+
+    if date_max is not None:
+        selected &= manifest['min_date'] <= pd.Timestamp(date_max)
+
+    if date_min is not None:
+        selected &= manifest['max_date'] >= pd.Timestamp(date_min)
+
+    if cities is not None and (manifest['city'] != '').all():
+        selected &= manifest['city'].isin(cities)
+
+    return manifest.loc[selected, :]
+
+def load_partitions(directory='partitions', date_max=None, cities=None, date_min=None, columns=None):
+    """
+    This function reads only the partitions that the date interval and the
+    city filter can touch, so the load cost follows the selected window
+    instead of the whole history. Rows of partially covered partitions are
+    still filtered by the pages.
+
+    The selected files are read by a single call, which is much faster than one
+    read per file when most partitions are selected (the default page state).
+
+    Input: partition directory, last date, list of cities, first date, columns to read
+    Output: Dataframe
+    """
+
+    manifest = prune_partitions(directory, date_max, cities, date_min)
+
+    # With nothing selected, a single partition is read only to keep the columns and dtypes
+    paths = manifest['path'] if not manifest.empty else prune_partitions(directory)['path'].head(1)
+
+    # The date=/city= folders are not read as columns, the files already have them
+    table = pq.read_table([os.path.join(directory, path) for path in paths], columns=columns, partitioning=None)
+    df = table.to_pandas()
+
+    return df if not manifest.empty else df.iloc[0:0]
+
+def load_id_lookup(directory='partitions', columns=('ID', 'Delivery_person_ID')):
+    """
+    This function reads the reverse lookup tables stored with the partitions.
+
+    Input: partition directory, identifier columns
+    Output: dictionary {column: Index of labels}
+    """
+
+    return {column: pd.Index(pd.read_parquet(os.path.join(directory, 'id_lookup', f'{column}.parquet'))[column])
+            for column in columns}
+
+def rollup_frequency(dates, base_freq='D', max_points=200):
+    """
+    This function chooses the finest period, starting at base_freq, for which
+    the date interval has at most max_points periods, so the chart payload stays
+    bounded whatever the length of the history.
+
+    Input: Series of dates, finest frequency allowed, maximum number of points
+    Output: pandas period frequency
+    """
+
+    frequencies = ROLLUP_FREQUENCIES[ROLLUP_FREQUENCIES.index(base_freq):]
+
+    if dates.empty:
+        return frequencies[0]
+
+    for freq in frequencies:
+        if len(pd.period_range(dates.min(), dates.max(), freq=freq)) <= max_points:
+            return freq
+
+    return frequencies[-1]
+
+def orders_per_period(df, freq):
+    """
+    This function counts the orders in each period, labelled by the first day of the period.
+
+    Input: Dataframe, pandas period frequency
+    Output: Dataframe with the columns Order_Date and ID (quantity of orders)
+    """
+
+    period_start = df['Order_Date'].dt.to_period(freq).dt.start_time
+
+    return df['ID'].groupby(period_start.rename('Order_Date')).count().reset_index()
+
+def filter_orders(df, date_max=None, traffic=None, cities=None):
+    """
+    This function applies the sidebar filters of the pages: orders up to
+    date_max, in the selected traffic densities and in the selected cities.
+    A filter set to None is not applied.
+
+    Input: Dataframe, last date, list of traffic densities, list of cities
+    Output: Dataframe
+    """
+
+    # Date filter
+    if date_max is not None:
+        df = df.loc[df['Order_Date'] <= pd.Timestamp(date_max), :]
+
+    # Traffic filter
+    if traffic is not None:
+        df = df.loc[df['Road_traffic_density'].isin(traffic), :]
+
+    # City Filter
+    if cities is not None:
+        df = df.loc[df['City'].isin(cities), :]
+
+    return df
+
+def load_filtered(directory='partitions', date_max=None, traffic=None, cities=None, columns=None):
+    """
+    This function reads the partitions selected by the date and city filters
+    and applies the sidebar filters to their rows.
+
+    Input: partition directory, last date, list of traffic densities, list of cities, columns to read
+    Output: Dataframe
+    """
+
+    df = load_partitions(directory, date_max=date_max, cities=cities, columns=columns)
+
+    return filter_orders(df, date_max, traffic, cities)
+
+# ----------------------
+# Aggregations
+# ----------------------
+
+def daily_orders(df, resolution='Auto', max_points=CHART_MAX_POINTS):
+    """
+    This function counts the orders per day. With the 'Auto' resolution, long
+    date intervals are rolled up to weeks, months and so on, keeping the number
+    of points bounded. Any other resolution in RESOLUTIONS is used as is.
+
+    Output: Dataframe with the columns Order_Date and ID (quantity of orders)
+    """
+
+    if resolution == 'Auto':
+        freq = rollup_frequency(df['Order_Date'], 'D', max_points)
+    else:
+        freq = RESOLUTIONS[resolution]
+
+    return orders_per_period(df, freq)
+
+def weekly_orders(df, max_points=CHART_MAX_POINTS):
+    """
+    This function counts the orders per week, labelled by the first day of each
+    week. Long date intervals are rolled up to months and so on.
+
+    Output: Dataframe with the columns Order_Date and ID (quantity of orders)
+    """
+
+    return orders_per_period(df, rollup_frequency(df['Order_Date'], 'W', max_points))
+
+def traffic_share(df):
+    """
+    This function computes the quantity and the percentage of orders in each traffic density.
+
+    Output: Dataframe with the columns Road_traffic_density, ID and perc_ID
+    """
+
+    df_aux = (df.loc[:, ['ID', 'Road_traffic_density']].groupby( 'Road_traffic_density' )
+                                                        .count()
+                                                        .reset_index())
+    df_aux['perc_ID'] = 100 * ( df_aux['ID'] / df_aux['ID'].sum() )
+
+    return df_aux
+
+def city_traffic_orders(df):
+    """
+    This function counts the orders of each traffic density in each city.
+
+    Output: Dataframe with the columns City, Road_traffic_density and ID
+    """
+
+    return (df[['ID', 'City', 'Road_traffic_density']].groupby(['City', 'Road_traffic_density'])
+                                                      .count()
+                                                      .reset_index())
+
+def location_medians(df):
+    """
+    This function computes the median delivery location of each traffic density in each city.
+    """
+
+    return (df[['City', 'Road_traffic_density', 'Delivery_location_latitude', 'Delivery_location_longitude']]
+            .groupby(['City', 'Road_traffic_density'])
+            .median()
+            .reset_index())
+
+def deliverymen_summary(df):
+    """
+    This function computes the general information about the deliverymen.
+
+    Output: dictionary
+    """
+
+    return {'deliverymen':          int(df['Delivery_person_ID'].nunique()),
+            'oldest_deliveryman':   df['Delivery_person_Age'].max(),
+            'youngest_deliveryman': df['Delivery_person_Age'].min(),
+            'best_condition':       df['Vehicle_condition'].max(),
+            'worst_condition':      df['Vehicle_condition'].min()}
+
+def rating_stats(df, column):
+    """
+    This function computes the average and the standard deviation of the rating for each value of column.
+
+    Output: Dataframe with the columns column, avg_rating and std_rating
+    """
+
+    df_aux = (df[['Delivery_person_Ratings', column]]
+              .groupby([column])
+              .agg({'Delivery_person_Ratings': ['mean', 'std']}))
+
+    df_aux.columns = ['avg_rating', 'std_rating']
+
+    return df_aux.reset_index()
+
+def courier_ranking(df, ascending=True, n=10):
+    """
+    This function ranks the couriers of each city by their average delivery time
+    and keeps the first n of each city: the fastest when ascending is True and
+    the slowest otherwise. Delivery_person_ID keeps the int32 codes.
+
+    Output: Dataframe with the columns City, Delivery_person_ID and Time_taken(min)
+    """
+
+    df_aux = (df[['Delivery_person_ID', 'Time_taken(min)', 'City']]
+                        .groupby(['City', 'Delivery_person_ID']).mean()
+                        .sort_values(by=['City','Time_taken(min)'], ascending = ascending).reset_index())
+
+    df_aux1 = df_aux.loc[df_aux['City'] == 'Metropolitian', :].head(n)
+    df_aux2 = df_aux.loc[df_aux['City'] == 'Urban', :].head(n)
+    df_aux3 = df_aux.loc[df_aux['City'] == 'Semi-Urban', :].head(n)
+
+    return pd.concat([df_aux1, df_aux2, df_aux3])
+
+def time_stats(df, columns):
+    """
+    This function computes the average and the standard deviation of the
+    delivery time for each combination of the values of columns.
+
+    Output: Dataframe with the columns in columns, avg_time and std_time
+    """
+
+    df_aux = (df[columns + ['Time_taken(min)']]
+              .groupby(columns)
+              .agg({'Time_taken(min)': ['mean', 'std']}))
+
+    df_aux.columns = ['avg_time', 'std_time']
+
+    return df_aux.reset_index()
+
+def distance_by_city(df):
+    """
+    This function computes the average distance (km) between the restaurants
+    and the delivery location points in each city.
+
+    Output: Dataframe with the columns City and distance
+    """
+
+    # haversine_vector does not accept empty arrays
+    if df.empty:
+        return pd.DataFrame({'City': pd.Series(dtype=object), 'distance': pd.Series(dtype=np.float64)})
+
+    distance = haversine_vector(df[['Restaurant_latitude', 'Restaurant_longitude']].to_numpy(np.float64),
+                                df[['Delivery_location_latitude', 'Delivery_location_longitude']].to_numpy(np.float64))
+
+    return (pd.Series(distance, index=df.index, name='distance')
+            .groupby(df['City']).mean()
+            .reset_index())
+
+# ----------------------
+# Metrics
+# ----------------------
+
+# Each metric has a function of (Dataframe, options, reverse lookup tables)
+# and the allowed values of its options, the first one being the default.
+
+METRICS = {
+    'orders_per_day':       {'function': lambda df, options, id_lookup: daily_orders(df, options['resolution']),
+                             'options': {'resolution': ['Auto'] + list(RESOLUTIONS)}},
+    'orders_per_week':      {'function': lambda df, options, id_lookup: weekly_orders(df),
+                             'options': {}},
+    'traffic_share':        {'function': lambda df, options, id_lookup: traffic_share(df),
+                             'options': {}},
+    'city_traffic_orders':  {'function': lambda df, options, id_lookup: city_traffic_orders(df),
+                             'options': {}},
+    'location_medians':     {'function': lambda df, options, id_lookup: location_medians(df),
+                             'options': {}},
+    'deliverymen_summary':  {'function': lambda df, options, id_lookup: deliverymen_summary(df),
+                             'options': {}},
+    'rating_stats':         {'function': lambda df, options, id_lookup: rating_stats(df, options['by']),
+                             'options': {'by': ['Vehicle_condition', 'Type_of_order',
+                                                'Road_traffic_density', 'Weatherconditions']}},
+    'courier_ranking':      {'function': lambda df, options, id_lookup: decode_ids(courier_ranking(df, options['order'] == 'fastest'),
+                                                                                   id_lookup, 'Delivery_person_ID'),
+                             'options': {'order': ['fastest', 'slowest']}},
+    'time_stats':           {'function': lambda df, options, id_lookup: time_stats(df, options['by'].split(',')),
+                             'options': {'by': ['City', 'Festival', 'City,Type_of_order', 'City,Road_traffic_density']}},
+    'distance_by_city':     {'function': lambda df, options, id_lookup: distance_by_city(df),
+                             'options': {}},
+}
+
+def metric_options(metric, options):
+    """
+    This function fills the missing options of a metric with their defaults
+    and checks that every option has an allowed value.
+
+    Input: metric name, dictionary {option: value}
+    Output: dictionary {option: value}
+    """
+
+    allowed_options = METRICS[metric]['options']
+
+    unknown = set(options) - set(allowed_options)
+    if unknown:
+        raise ValueError(f'unknown parameters: {", ".join(sorted(unknown))}')
+
+    options = {name: options.get(name, allowed[0]) for name, allowed in allowed_options.items()}
+    for name, value in options.items():
+        if value not in allowed_options[name]:
+            raise ValueError(f'{name} must be one of: {", ".join(allowed_options[name])}')
+
+    return options
+
+def metric_entry(metric, options):
+    """
+    This function names the result of a metric with its options, e.g. 'rating_stats?by=City'.
+    """
+
+    return metric + ''.join(f'{"?" if i == 0 else "&"}{name}={value}'
+                            for i, (name, value) in enumerate(sorted(options.items())))
+
+def metric_entries():
+    """
+    This function lists every metric with every combination of its options.
+
+    Output: list of (metric, options)
+    """
+
+    entries = []
+    for metric, settings in METRICS.items():
+        names = list(settings['options'])
+        for values in itertools.product(*settings['options'].values()):
+            entries.append((metric, dict(zip(names, values))))
+
+    return entries
+
+def compute_metric(metric, df, id_lookup=None, snapshot=None, **options):
+    """
+    This function returns a metric from the snapshot when it has one,
+    computing it from the filtered Dataframe otherwise.
+
+    Input: metric name, filtered Dataframe, reverse lookup tables, snapshot, options
+    Output: Dataframe or dictionary
+    """
+
+    options = metric_options(metric, options)
+    entry = metric_entry(metric, options)
+
+    if snapshot is not None and entry in snapshot:
+        return snapshot[entry]
+
+    return METRICS[metric]['function'](df, options, id_lookup)
+
+def metric_records(result):
+    """
+    This function converts the result of a metric into JSON serializable records.
+    Missing values, e.g. the ages of an empty selection, become None (null in JSON).
+    """
+
+    if isinstance(result, pd.DataFrame):
+        return json.loads(result.to_json(orient='records', date_format='iso'))
+
+    records = {key: value.item() if hasattr(value, 'item') else value for key, value in result.items()}
+
+    return {key: None if isinstance(value, float) and np.isnan(value) else value for key, value in records.items()}
+
+# ----------------------
+# Snapshots
+# ----------------------
+
+def dataset_version(directory='partitions'):
+    """
+    This function identifies the partitioned dataset by the hash of its manifest.
+    """
+
+    with open(os.path.join(directory, 'manifest.csv'), 'rb') as file:
+        return hashlib.sha1(file.read()).hexdigest()[:16]
+
+def normalize_list(values, allowed, name):
+    """
+    This function turns a filter into a sorted tuple of allowed values. A missing
+    filter, or one with every allowed value, becomes None (no filter).
+
+    Input: list of values or comma separated string, allowed values, filter name
+    Output: tuple or None
+    """
+
+    if values is None:
+        return None
+
+    if isinstance(values, str):
+        values = values.split(',')
+
+    selected = sorted({value.strip() for value in values if value.strip()})
+    unknown = set(selected) - set(allowed)
+
+    if unknown:
+        raise ValueError(f'unknown {name}: {", ".join(sorted(unknown))}')
+
+    return None if len(selected) == len(allowed) else tuple(selected)
+
+def normalize_filters(directory, date_max=None, traffic=None, cities=None):
+    """
+    This function returns the sidebar filters in a canonical form, so equivalent
+    filter states share the same snapshot and cache entries. A date on or after
+    the last order of the dataset selects everything, so it becomes None.
+
+    Input: partition directory, last date, traffic densities, cities
+    Output: dictionary {'date', 'traffic', 'city'}
+    """
+
+    if date_max is not None:
+        date_max = pd.Timestamp(date_max)
+        if pd.isna(date_max):
+            raise ValueError('date must be a date, e.g. 2022-03-01')
+
+        date_max = date_max.normalize()
+        if date_max >= prune_partitions(directory)['max_date'].max():
+            date_max = None
+
+    return {'date':     None if date_max is None else date_max.strftime('%Y-%m-%d'),
+            'traffic':  normalize_list(traffic, TRAFFIC_OPTIONS, 'traffic'),
+            'city':     normalize_list(cities, CITY_OPTIONS, 'city')}
+
+def snapshot_key(filters):
+    """
+    This function builds the key of a normalized filter state in the snapshot index.
+    """
+
+    return json.dumps(filters, sort_keys=True)
+
+def read_snapshot(directory='snapshots', partitions='partitions', date_max=None, traffic=None, cities=None):
+    """
+    This function returns the precomputed metrics of a filter state, when the batch
+    export has a snapshot of it for the current dataset version with every metric.
+
+    Input: snapshot directory, partition directory, last date, traffic densities, cities
+    Output: dictionary {metric entry: Dataframe or dictionary}, or None
+    """
+
+    index_path = os.path.join(directory, 'index.json')
+    if not os.path.exists(index_path):
+        return None
+
+    with open(index_path) as file:
+        index = json.load(file)
+
+    folder = index['snapshots'].get(snapshot_key(normalize_filters(partitions, date_max, traffic, cities)))
+    if index['version'] != dataset_version(partitions) or folder is None:
+        return None
+
+    with open(os.path.join(directory, folder, 'metrics.json')) as file:
+        stored = json.load(file)
+
+    # Snapshots without the columns of their tables predate them and are not used
+    if 'columns' not in stored:
+        return None
+
+    if any(metric_entry(metric, options) not in stored['metrics'] for metric, options in metric_entries()):
+        return None
+
+    return snapshot_metrics(stored['metrics'], stored['columns'])
+
+def snapshot_metrics(records, columns):
+    """
+    This function rebuilds the metrics of a snapshot from their JSON records. The
+    tables are rebuilt with their stored columns, so the tables of a filter state
+    without any order keep their columns as well.
+
+    Input: dictionary {metric entry: records}, dictionary {metric entry: list of columns}
+    Output: dictionary {metric entry: Dataframe or dictionary}
+    """
+
+    snapshot = {}
+    for entry, data in records.items():
+        if isinstance(data, list):
+            data = pd.DataFrame.from_records(data, columns=columns[entry])
+            if 'Order_Date' in data.columns:
+                data['Order_Date'] = pd.to_datetime(data['Order_Date']).dt.tz_localize(None)
+        snapshot[entry] = data
+
+    return snapshot
+
+# ----------------------
+# Export
+# ----------------------
+
+class ChunkSink(io.RawIOBase):
+    """
+    Write-only stream that keeps what was written since the last drain, so a
+    Parquet file can be sent in pieces while the writer still sees a growing file.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def dataset_columns(directory='partitions'):
+    """
+    This function lists the columns of the partitioned dataset.
+    """
+
+    path = prune_partitions(directory)['path'].iloc[0]
+
+    return pq.read_schema(os.path.join(directory, path)).names
+
+def filtered_chunks(directory, date_max, traffic, cities, columns, read_columns, chunk_rows):
+    """
+    This function reads the partitions selected by the date and city filters in
+    batches, filters their rows and yields them in chunks of at least chunk_rows
+    rows (except the last one), whatever the size of each partition.
+
+    Input: partition directory, last date, traffic densities, cities, returned columns,
+           columns read, rows per chunk
+    Output: generator of Dataframes
+    """
+
+    buffer, buffered_rows = [], 0
+
+    for path in prune_partitions(directory, date_max, cities)['path']:
+        for batch in pq.ParquetFile(os.path.join(directory, path)).iter_batches(batch_size=chunk_rows, columns=read_columns):
+            df_batch = filter_orders(batch.to_pandas(), date_max, traffic, cities)[columns]
+            buffer.append(df_batch)
+            buffered_rows += len(df_batch)
+
+            if buffered_rows >= chunk_rows:
+                yield pd.concat(buffer, ignore_index=True)
+                buffer, buffered_rows = [], 0
+
+    if buffered_rows > 0:
+        yield pd.concat(buffer, ignore_index=True)
+
+def export_orders(directory='partitions', date_max=None, traffic=None, cities=None, columns=None,
+                  file_format='csv', chunk_rows=EXPORT_CHUNK_ROWS):
+    """
+    This function streams the orders that match the sidebar filters as CSV or Parquet.
+
+    Only the partitions selected by the date and city filters are read, in batches
+    of chunk_rows rows and with only the exported and filtered columns. Filtered rows
+    are buffered until chunk_rows of them are encoded and yielded together (a single
+    Parquet row group), so the memory used does not depend on the size of the export.
+    Identifiers are exported as labels.
+
+    Input: partition directory, last date, traffic densities, cities, exported columns,
+           'csv' or 'parquet', rows per batch
+    Output: generator of bytes
+    """
+
+    all_columns = dataset_columns(directory)
+    columns = all_columns if columns is None else list(columns)
+
+    if not columns:
+        raise ValueError('no columns selected')
+
+    unknown = set(columns) - set(all_columns)
+    if unknown:
+        raise ValueError(f'unknown columns: {", ".join(sorted(unknown))}')
+    if file_format not in ['csv', 'parquet']:
+        raise ValueError('format must be csv or parquet')
+
+    read_columns = [column for column in all_columns
+                    if column in columns or column in ['Order_Date', 'Road_traffic_density', 'City']]
+    id_lookup = load_id_lookup(directory, [column for column in ['ID', 'Delivery_person_ID'] if column in columns])
+
+    sink = ChunkSink()
+    writer = None
+    header = True
+
+    for df_chunk in filtered_chunks(directory, date_max, traffic, cities, columns, read_columns, chunk_rows):
+        for column in id_lookup:
+            df_chunk = decode_ids(df_chunk, id_lookup, column)
+
+        if file_format == 'csv':
+            yield df_chunk.to_csv(index=False, header=header).encode('utf-8')
+            header = False
+        else:
+            table = pa.Table.from_pandas(df_chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(sink, table.schema)
+            writer.write_table(table.cast(writer.schema))
+            yield sink.drain()
+
+    # Exports without rows still have the header or the schema of the columns
+    if file_format == 'csv':
+        if header:
+            yield pd.DataFrame(columns=columns).to_csv(index=False).encode('utf-8')
+    else:
+        if writer is None:
+            schema = pq.read_schema(os.path.join(directory, prune_partitions(directory)['path'].iloc[0]))
+            fields = [pa.field(column, pa.string()) if column in ['ID', 'Delivery_person_ID'] else schema.field(column)
+                      for column in columns]
+            writer = pq.ParquetWriter(sink, pa.schema(fields))
+        writer.close()
+        yield sink.drain()
+
+def export_url(file_format, columns, date_max=None, traffic=None, cities=None, api_url=EXPORT_API_URL):
+    """
+    This function builds the address of the API export of the filtered orders.
+    """
+
+    query = {'format': file_format, 'columns': ','.join(columns)}
+
+    if date_max is not None:
+        query['date'] = pd.Timestamp(date_max).strftime('%Y-%m-%d')
+    if traffic is not None:
+        query['traffic'] = ','.join(traffic)
+    if cities is not None:
+        query['city'] = ','.join(cities)
+
+    return f'{api_url}/export?{urlencode(query)}'
+
+# ----------------------
+# Dtype report
+# ----------------------
+
+if __name__ == '__main__':
+
+    df_reference, id_lookup = encode_ids(clean_code(pd.read_csv('train.csv')))
+    df_compact = optimize_dtypes(df_reference)
+
+    print('Memory usage (MB)')
+    print(memory_report(df_reference, df_compact).to_string())
+    print()
+
+    accuracy = check_accuracy(df_reference, df_compact)
+    print('Accuracy of the page aggregates')
+    print(accuracy.to_string(index=False))
+
+    if not accuracy['ok'].all():
+        raise SystemExit(1)
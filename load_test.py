@@ -0,0 +1,309 @@
+# Load Test
+
+# Drives the dashboard pages headlessly with concurrent simulated sessions
+# and reports the rerun latency, the throughput and the memory of each process.
+#
+# Usage: python load_test.py --rows 45000 --processes 2 --sessions 8 --reruns 20
+
+# Importing libraries
+
+import argparse
+import os
+import random
+import resource
+import runpy
+import shutil
+import sys
+import threading
+import time
+
+import pandas               as pd
+import numpy                as np
+
+from concurrent.futures     import  ProcessPoolExecutor, ThreadPoolExecutor
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, REPO_DIR)
+
+from food_data              import  ensure_partitions, TRAFFIC_OPTIONS, CITY_OPTIONS
+
+# ----------------------
+# Settings
+# ----------------------
+
+PAGES = ['Company_View', 'Delivery_View', 'Restaurants_View']
+
+CITY_CODES      = ['INDO', 'BANG', 'COIMB', 'CHEN', 'HYD', 'RANCHI', 'MYS', 'DEH', 'KOC', 'PUNE',
+                   'LUDH', 'KNP', 'MUM', 'KOL', 'JAP', 'SUR', 'GOA', 'AURG', 'AGR', 'VAD', 'ALH', 'BHP']
+
+START_DATE = '2022-02-11'
+
+# Filters, random generator and Streamlit context of the simulated session running in the current thread
+session = threading.local()
+
+# ----------------------
+# Functions
+# ----------------------
+
+def synthetic_dataset(rows, days, couriers, seed):
+    """
+    This function generates a dataset with the same columns and raw text
+    format as train.csv, so the pages run their whole load and cleaning.
+
+    Input: number of rows, number of days from START_DATE, number of couriers, random seed
+    Output: Dataframe
+    """
+
+    rng = np.random.default_rng(seed)
+
+    courier_ids = np.array([f'{rng.choice(CITY_CODES)}RES{rng.integers(1, 21):02d}DEL{rng.integers(1, 4):02d} '
+                            for _ in range(couriers)])
+    courier = rng.integers(0, couriers, rows)
+
+    city_lat = rng.uniform(10, 30, len(CITY_CODES))
+    city_lon = rng.uniform(72, 88, len(CITY_CODES))
+    city = rng.integers(0, len(CITY_CODES), rows)
+
+    restaurant_lat = city_lat[city] + rng.normal(0, 0.05, rows)
+    restaurant_lon = city_lon[city] + rng.normal(0, 0.05, rows)
+
+    dates = pd.Timestamp(START_DATE) + pd.to_timedelta(rng.integers(0, days, rows), unit='D')
+
+    df = pd.DataFrame({
+        'ID':                           [f'0x{i:x} ' for i in range(rows)],
+        'Delivery_person_ID':           courier_ids[courier],
+        'Delivery_person_Age':          rng.integers(20, 40, rows).astype(str),
+        'Delivery_person_Ratings':      np.round(rng.uniform(2.5, 5.0, rows), 1).astype(str),
+        'Restaurant_latitude':          restaurant_lat,
+        'Restaurant_longitude':         restaurant_lon,
+        'Delivery_location_latitude':   restaurant_lat + rng.normal(0, 0.05, rows),
+        'Delivery_location_longitude':  restaurant_lon + rng.normal(0, 0.05, rows),
+        'Order_Date':                   dates.strftime('%d-%m-%Y'),
+        'Time_Orderd':                  '11:30:00',
+        'Time_Order_picked':            '11:45:00',
+        'Weatherconditions':            rng.choice(['conditions Sunny', 'conditions Stormy', 'conditions Sandstorms',
+                                                    'conditions Cloudy', 'conditions Fog', 'conditions Windy'], rows),
+        'Road_traffic_density':         rng.choice([f'{option} ' for option in TRAFFIC_OPTIONS], rows),
+        'Vehicle_condition':            rng.integers(0, 3, rows),
+        'Type_of_order':                rng.choice(['Snack ', 'Meal ', 'Drinks ', 'Buffet '], rows),
+        'Type_of_vehicle':              rng.choice(['motorcycle ', 'scooter ', 'electric_scooter '], rows),
+        'multiple_deliveries':          rng.integers(0, 4, rows).astype(str),
+        'Festival':                     rng.choice(['No ', 'Yes '], rows, p=[0.98, 0.02]),
+        'City':                         rng.choice([f'{option} ' for option in CITY_OPTIONS], rows),
+        'Time_taken(min)':              [f'(min) {minutes}' for minutes in rng.integers(10, 55, rows)]})
+
+    # About 4% of the raw rows have a missing value, as in the original dataset
+    missing = rng.random(rows) < 0.04
+    df.loc[missing, 'multiple_deliveries'] = 'NaN '
+
+    return df
+
+def prepare_workdir(workdir, rows, days, couriers, seed):
+    """
+    This function writes the synthetic train.csv and its partitions into workdir,
+    together with the logo used by the pages, so every run starts from the same data.
+
+    Input: working directory, number of rows, number of days, number of couriers, random seed
+    Output: None
+    """
+
+    if os.path.exists(workdir):
+        shutil.rmtree(workdir)
+    os.makedirs(workdir)
+
+    synthetic_dataset(rows, days, couriers, seed).to_csv(os.path.join(workdir, 'train.csv'), index=False)
+    shutil.copy(os.path.join(REPO_DIR, 'logo.png'), workdir)
+    ensure_partitions(os.path.join(workdir, 'train.csv'), os.path.join(workdir, 'partitions'))
+
+    return None
+
+def random_filters(rng, days):
+    """
+    This function draws the sidebar filters of a rerun: a date inside the
+    history and a non-empty subset of the traffic densities and of the city types.
+    """
+
+    return {'Time interval':    pd.Timestamp(START_DATE) + pd.Timedelta(days=rng.randrange(days)),
+            'Traffic density':  rng.sample(TRAFFIC_OPTIONS, rng.randint(1, len(TRAFFIC_OPTIONS))),
+            'City type':        rng.sample(CITY_OPTIONS, rng.randint(1, len(CITY_OPTIONS)))}
+
+def patch_widgets():
+    """
+    This function replaces the sidebar widgets used by the pages, so each simulated
+    session reads the filters drawn for its current rerun instead of the defaults.
+    """
+
+    from streamlit.delta_generator import DeltaGenerator
+    from streamlit.logger import set_log_level
+
+    set_log_level('error')
+
+    def slider(self, label, *args, **kwargs):
+        return session.filters.get(label, kwargs.get('value'))
+
+    def multiselect(self, label, options, *args, **kwargs):
+        return session.filters.get(label, kwargs.get('default', list(options)))
+
+    def selectbox(self, label, options, *args, **kwargs):
+        return session.rng.choice(list(options))
+
+    DeltaGenerator.slider       = slider
+    DeltaGenerator.multiselect  = multiselect
+    DeltaGenerator.selectbox    = selectbox
+
+    return None
+
+def attach_context(session_id):
+    """
+    This function attaches a Streamlit script run context to the current thread,
+    as the server does for each session. The pages then go through the real
+    element path, including the page config checks, and the messages they send
+    to the browser are kept in session.messages instead.
+    """
+
+    from streamlit.runtime.scriptrunner import ScriptRunContext, add_script_run_ctx
+    from streamlit.runtime.state import SafeSessionState, SessionState
+    from streamlit.runtime.uploaded_file_manager import UploadedFileManager
+
+    session.messages = []
+    session.context = ScriptRunContext(session_id=f'load-test-{session_id}',
+                                       _enqueue=session.messages.append,
+                                       query_string='',
+                                       session_state=SafeSessionState(SessionState()),
+                                       uploaded_file_mgr=UploadedFileManager(),
+                                       page_script_hash='',
+                                       user_info={'email': 'test@example.com'})
+    add_script_run_ctx(threading.current_thread(), session.context)
+
+    return None
+
+def run_page(page):
+    """
+    This function runs a page script from top to bottom, as a Streamlit rerun does.
+    An exception raised by the page stops the load test.
+    """
+
+    session.context.reset()
+    session.context.on_script_start()
+    session.messages.clear()
+
+    try:
+        runpy.run_path(os.path.join(REPO_DIR, 'pages', f'{page}.py'), run_name='__main__')
+    except Exception as error:
+        raise RuntimeError(f'{page} failed: {error}') from error
+
+    return None
+
+def run_session(session_id, pages, reruns, days, seed):
+    """
+    This function simulates a user: each rerun opens a random page with random filters.
+
+    Output: list of (page, latency in seconds)
+    """
+
+    attach_context(session_id)
+    session.rng = random.Random(seed * 100003 + session_id)
+    latencies = []
+
+    for _ in range(reruns):
+        page = session.rng.choice(pages)
+        session.filters = random_filters(session.rng, days)
+
+        start = time.perf_counter()
+        run_page(page)
+        latencies.append((page, time.perf_counter() - start))
+
+    return latencies
+
+def run_process(process_id, workdir, pages, sessions, reruns, days, seed):
+    """
+    This function runs concurrent sessions as threads of a single process,
+    like the sessions served by one Streamlit server, after a warm-up run
+    of each page that is not measured.
+
+    Output: dictionary with the latencies, the wall time and the peak RSS of the process
+    """
+
+    os.chdir(workdir)
+    patch_widgets()
+
+    attach_context(f'warm-up-{process_id}')
+    session.rng = random.Random(seed)
+    session.filters = {}
+    for page in pages:
+        run_page(page)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        futures = [executor.submit(run_session, process_id * sessions + i, pages, reruns, days, seed)
+                   for i in range(sessions)]
+        latencies = [latency for future in futures for latency in future.result()]
+    wall_time = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on Linux
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    return {'process': process_id, 'latencies': latencies, 'wall_time': wall_time, 'rss_mb': rss_mb}
+
+def report(results):
+    """
+    This function summarizes the rerun latency percentiles by page, the throughput
+    and the peak RSS of each process.
+
+    Output: Dataframe of latencies, Dataframe of processes
+    """
+
+    df_latency = pd.DataFrame([latency for result in results for latency in result['latencies']],
+                              columns=['page', 'latency'])
+    df_latency['latency'] = 1000 * df_latency['latency']
+
+    df_aux = df_latency.groupby('page')['latency'].describe(percentiles=[0.5, 0.95, 0.99])
+    df_aux.loc['All'] = df_latency['latency'].describe(percentiles=[0.5, 0.95, 0.99])
+    df_aux = df_aux[['count', '50%', '95%', '99%', 'max']].rename(columns={'50%': 'p50_ms', '95%': 'p95_ms',
+                                                                           '99%': 'p99_ms', 'max': 'max_ms'})
+
+    df_process = pd.DataFrame([{'process': result['process'],
+                                'reruns': len(result['latencies']),
+                                'wall_time_s': result['wall_time'],
+                                'reruns_per_s': len(result['latencies']) / result['wall_time'],
+                                'peak_rss_mb': result['rss_mb']} for result in results])
+
+    return np.round(df_aux, 1), np.round(df_process, 2)
+
+# ----------------------
+# Load test
+# ----------------------
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(description='Concurrent-session load test of the dashboard pages.')
+    parser.add_argument('--rows', type=int, default=45000, help='rows of the synthetic dataset')
+    parser.add_argument('--days', type=int, default=55, help='days of history from ' + START_DATE)
+    parser.add_argument('--couriers', type=int, default=1300, help='distinct couriers')
+    parser.add_argument('--processes', type=int, default=1, help='server processes')
+    parser.add_argument('--sessions', type=int, default=8, help='concurrent sessions per process')
+    parser.add_argument('--reruns', type=int, default=20, help='reruns per session')
+    parser.add_argument('--pages', nargs='+', default=PAGES, choices=PAGES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', default='load_test_data')
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir)
+    prepare_workdir(workdir, args.rows, args.days, args.couriers, args.seed)
+
+    with ProcessPoolExecutor(max_workers=args.processes) as executor:
+        futures = [executor.submit(run_process, i, workdir, args.pages, args.sessions, args.reruns, args.days, args.seed)
+                   for i in range(args.processes)]
+        results = [future.result() for future in futures]
+
+    df_latency, df_process = report(results)
+
+    print(f'{args.processes} process(es) x {args.sessions} session(s) x {args.reruns} rerun(s), {args.rows} rows')
+    print()
+    print('Rerun latency (ms)')
+    print(df_latency.to_string())
+    print()
+    print('Processes')
+    print(df_process.to_string(index=False))
+    print()
+    print(f'Throughput: {df_process["reruns_per_s"].sum():.2f} reruns/s')
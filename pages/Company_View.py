@@ -3,70 +3,31 @@
 # Importing libraries
 
 import pandas               as pd
-import numpy                as np
 import plotly.express       as px
 import streamlit            as st
 
 import folium
 
 from PIL                    import  Image
+from food_data              import  ensure_partitions, load_filtered, read_snapshot, compute_metric, RESOLUTIONS
+from food_data              import  dataset_version
+from rolling_metrics        import  load_rolling_metrics
+from sidebar                import  export_sidebar
 from streamlit_folium       import  folium_static
 
 # ----------------------
 # Functions
 # ----------------------
 
-def clean_code(df_raw):
-    """
-    The purpose of this function is cleaning the Dataframe
-
-    Types of cleaning:
-     1. Removal of 'NaN ' string data and its removal from Dataframe
-     2. Conversion of text columns to number
-     3. Conversion of text columns to datetime
-     4. Time_taken(min) column split and text to number conversion
-     5. Removing spaces inside strings/text/object
-    
-    Input: Dataframe
-    Output: Dataframe
-    """
-
-    # 1. Removal of 'NaN ' string data and its removal from Dataframe
-
-    df_clean = df_raw.replace('NaN ', np.nan).dropna()
-
-    # 2. Conversion of text columns to number
-
-    df_clean['Delivery_person_Age']         = df_clean['Delivery_person_Age'].astype(int)
-    df_clean['Delivery_person_Ratings']     = df_clean['Delivery_person_Ratings'].astype(float)
-    df_clean['multiple_deliveries']         = df_clean['multiple_deliveries'].astype(int)
-
-    # 3. Conversion of text columns to datetime
-
-    df_clean['Order_Date'] = pd.to_datetime(df_clean['Order_Date'], format = '%d-%m-%Y')
-
-    # 4. Time_taken(min) column split and text to number conversion
-    
-    df_clean['Time_taken(min)'] = df_clean['Time_taken(min)'].apply(lambda x: x.split('(min) ')[1])
-    df_clean['Time_taken(min)'] = df_clean['Time_taken(min)'].astype(int)
-    
-    # 5. Removing spaces inside strings/text/object
-
-    df_clean.loc[:, 'ID']                   = df_clean.loc[:, 'ID'].str.strip()
-    df_clean.loc[:, 'Road_traffic_density'] = df_clean.loc[:, 'Road_traffic_density'].str.strip()
-    df_clean.loc[:, 'Type_of_order']        = df_clean.loc[:, 'Type_of_order'].str.strip()
-    df_clean.loc[:, 'Type_of_vehicle']      = df_clean.loc[:, 'Type_of_vehicle'].str.strip()
-    df_clean.loc[:, 'City']                 = df_clean.loc[:, 'City'].str.strip()
-    df_clean.loc[:, 'Festival']             = df_clean.loc[:, 'Festival'].str.strip()
-  
-    return df_clean
-
-def orders_per_day(df):
+def orders_per_day(df, resolution, snapshot=None):
     """ 
     This function creates a bar chart to analyse the number of orders in each day of the dataset.
+
+    With the 'Auto' resolution, long date intervals are rolled up to weeks, months
+    and so on, keeping the number of bars bounded. Any other resolution is used as is.
     """
 
-    df_aux = df[['ID', 'Order_Date']].groupby(['Order_Date']).count().reset_index()
+    df_aux = compute_metric('orders_per_day', df, snapshot=snapshot, resolution=resolution)
     fig = px.bar(df_aux, x='Order_Date', y='ID', 
                  labels={'Order_Date':'Date', 'ID': 'Quantity'})
 
@@ -74,16 +35,13 @@ def orders_per_day(df):
 
     return fig
 
-def orders_by_traffic(df):
+def orders_by_traffic(df, snapshot=None):
     """ 
     This function creates a bar chart to analyse how the orders are distributed 
     according to the traffic density.
     """
 
-    df_aux = (df.loc[:, ['ID', 'Road_traffic_density']].groupby( 'Road_traffic_density' )
-                                                        .count()
-                                                        .reset_index())
-    df_aux['perc_ID'] = 100 * ( df_aux['ID'] / df_aux['ID'].sum() )
+    df_aux = compute_metric('traffic_share', df, snapshot=snapshot)
     fig = px.bar(df_aux, x = 'Road_traffic_density', y = 'perc_ID', 
                  labels={'Road_traffic_density':'Traffic Density', 'perc_ID': 'Percentage'})
 
@@ -91,15 +49,13 @@ def orders_by_traffic(df):
 
     return fig
 
-def orders_city_traffic(df):
+def orders_city_traffic(df, snapshot=None):
     """ 
     This function creates a bar chart to analyse how the orders are distributed 
     according to the traffic density in each city of the dataset.
     """
 
-    df_aux = (df[['ID', 'City', 'Road_traffic_density']].groupby(['City', 'Road_traffic_density'])
-                                                        .count()
-                                                        .reset_index())
+    df_aux = compute_metric('city_traffic_orders', df, snapshot=snapshot)
     fig = px.scatter(df_aux, x = 'City', y = 'Road_traffic_density', size = 'ID', color = 'City', 
                      labels={'City':'City', 'Road_traffic_density': 'Traffic Density'})
 
@@ -107,30 +63,27 @@ def orders_city_traffic(df):
 
     return fig
 
-def orders_per_week(df):
+def orders_per_week(df, snapshot=None):
     """ 
-    This function creates a column named Week_of_year to analyse how the 
-    number of orders change from week to week.
+    This function creates a line chart to analyse how the number of orders
+    change from week to week, labelled by the first day of each week.
+    Long date intervals are rolled up to months and so on.
     """
     
-    df['Week_of_year'] = df['Order_Date'].dt.strftime('%U')
-    df_aux = df[['ID', 'Week_of_year']].groupby(['Week_of_year']).count().reset_index()
-    fig = px.line(df_aux, x = 'Week_of_year', y = 'ID',
-                  labels={'Week_of_year': 'Week of Year', 'ID': 'Quantity'})
+    df_aux = compute_metric('orders_per_week', df, snapshot=snapshot)
+    fig = px.line(df_aux, x = 'Order_Date', y = 'ID',
+                  labels={'Order_Date': 'Week', 'ID': 'Quantity'})
 
     st.plotly_chart(fig, use_container_width=True)
 
     return fig
 
-def location_map(df):
+def location_map(df, snapshot=None):
     """ 
     This function creates a map to visualize the median point of traffic density in each city.
     """
 
-    df_aux = (df[['City', 'Road_traffic_density', 'Delivery_location_latitude', 'Delivery_location_longitude']]
-              .groupby(['City', 'Road_traffic_density'])
-              .median()
-              .reset_index())
+    df_aux = compute_metric('location_medians', df, snapshot=snapshot)
 
     map = folium.Map( location=[18.546947,75.898497], zoom_start=5.5 )
 
@@ -143,21 +96,36 @@ def location_map(df):
 
     return None
 
-# ----------------------
-# Load 
-# ----------------------
+def orders_trend(rolling_metrics, date_max, traffic, cities):
+    """ 
+    This function creates a line chart with the 7 and 28-day moving averages
+    of the number of orders per day.
+    """
 
-# Import dataset
+    df_aux = pd.concat([rolling_metrics.rolling(window, cities, traffic, date_max=date_max).assign(Window=f'{window} days')
+                        for window in [7, 28]])
+    fig = px.line(df_aux, x = 'Order_Date', y = 'orders', color = 'Window',
+                  labels={'Order_Date': 'Date', 'orders': 'Orders per day'})
 
-df_raw      = pd.read_csv('train.csv')
-df_clean    = clean_code(df_raw)
-df          = df_clean.copy()
+    st.plotly_chart(fig, use_container_width=True)
+
+    return fig
 
 # ----------------------
 # Streamlit
 
+# Called first: the cached loads below already send elements (their spinner) to the page
 st.set_page_config(page_title='Company View', layout="wide", initial_sidebar_state='expanded')
 
+# ----------------------
+# Load
+# ----------------------
+
+# Import dataset
+
+partitions = ensure_partitions('train.csv', 'partitions')
+rolling_metrics = load_rolling_metrics(partitions, dataset_version(partitions))
+
 # ----------------------
 # Sidebar
 
@@ -195,20 +163,27 @@ city_options = st.sidebar.multiselect(
     default=['Metropolitian','Urban','Semi-Urban']
 )
 
+st.sidebar.markdown('## Select the chart resolution')
+
+resolution = st.sidebar.selectbox(
+    'Orders per day',
+    ['Auto'] + list(RESOLUTIONS),
+    help='Auto rolls long intervals up to weeks or months. Day shows the full resolution.'
+)
+
+export_sidebar(partitions, date_slider, traffic_options, city_options)
+
 st.sidebar.markdown("""---""")
 st.sidebar.markdown('##### Powered by [Caio Casagrande](https://www.linkedin.com/in/caiopc/)')
 
 # ----------------------
 # Adapting dataset to filters
 
-# Date filter
-df = df.loc[df['Order_Date'] <= date_slider, :]
-
-# Traffic filter
-df = df.loc[df['Road_traffic_density'].isin(traffic_options), :]
+# Precomputed metrics of the batch export, when it has this filter state
+snapshot = read_snapshot('snapshots', partitions, date_slider, traffic_options, city_options)
 
-# City Filter
-df=df.loc[df['City'].isin(city_options),:]
+# Partition pruning by date and city, then date, traffic and city filters
+df = load_filtered(partitions, date_slider, traffic_options, city_options) if snapshot is None else None
 
 # ----------------------
 # Streamlit main page layout
@@ -222,7 +197,7 @@ with st.container():
     # 1. Quantity of orders per day
     st.markdown('## Quantity of orders per day')
 
-    orders_per_day(df)
+    orders_per_day(df, resolution, snapshot)
 
 # Second Section - 2 charts in 2 columns
 
@@ -234,13 +209,13 @@ with st.container():
         # 2. Distribution of orders by type of traffic
         st.markdown('## Orders by type of traffic')
 
-        orders_by_traffic(df)
+        orders_by_traffic(df, snapshot)
         
     with col2:
         # 3. Comparison of order volume by city and type of traffic
         st.markdown('## Order volume by city and type of traffic')
         
-        orders_city_traffic(df)
+        orders_city_traffic(df, snapshot)
 
 # Third Section - 1 chart
 
@@ -249,7 +224,14 @@ with st.container():
     # 4. Quantity of orders per week
     st.markdown('## Quantity of orders per week')
 
-    orders_per_week(df)
+    orders_per_week(df, snapshot)
+
+with st.container():
+
+    # 5. Moving average of the quantity of orders per day
+    st.markdown('## Moving average of orders per day')
+
+    orders_trend(rolling_metrics, date_slider, traffic_options, city_options)
 
 # Fourth Section - 1 map
 
@@ -258,10 +240,10 @@ with st.container():
     st.markdown("""---""")
     st.markdown('# Geolocation')
     
-    # 5. The central location of each city by type of traffic
+    # 6. The central location of each city by type of traffic
     st.markdown('## The central location of each city by type of traffic')
     
-    location_map(df)
+    location_map(df, snapshot)
 
 
 
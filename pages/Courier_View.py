@@ -0,0 +1,179 @@
+# Courier View
+
+# Libraries
+
+import pandas               as pd
+import plotly.express       as px
+import streamlit            as st
+
+from PIL                    import  Image
+from food_data              import  ensure_partitions, load_partitions, load_id_lookup, decode_ids, build_courier_index, courier_orders
+from food_data              import  dataset_version, filter_orders
+
+# ----------------------
+# Functions
+# ----------------------
+
+@st.experimental_singleton
+def load_courier_index(directory, version):
+    """
+    This function loads the whole partitioned dataset and builds the courier
+    index only once for each dataset version, sharing it between reruns and sessions.
+
+    Input: partition directory, dataset version
+    Output: sorted Dataframe, offsets, reverse lookup tables
+    """
+
+    df_clean            = load_partitions(directory)
+    id_lookup           = load_id_lookup(directory)
+    df_sorted, offsets  = build_courier_index(df_clean)
+
+    return df_sorted, offsets, id_lookup
+
+def rating_trend(df):
+    """
+    This function creates a line chart with the average rating of the courier in each day.
+    """
+
+    df_aux = df[['Order_Date', 'Delivery_person_Ratings']].groupby(['Order_Date']).mean().reset_index()
+    fig = px.line(df_aux, x='Order_Date', y='Delivery_person_Ratings', markers=True,
+                  labels={'Order_Date': 'Date', 'Delivery_person_Ratings': 'Rating'})
+
+    st.plotly_chart(fig, use_container_width=True)
+
+    return fig
+
+def time_distribution(df):
+    """
+    This function creates a box plot with the time taken by the courier
+    for each traffic density in each city.
+    """
+
+    fig = px.box(df, x='Road_traffic_density', y='Time_taken(min)', color='City',
+                 category_orders={'Road_traffic_density': ['Low', 'Medium', 'High', 'Jam']},
+                 labels={'Road_traffic_density': 'Traffic Density', 'Time_taken(min)': 'Time (min)'})
+
+    st.plotly_chart(fig, use_container_width=True)
+
+    return fig
+
+# ----------------------
+# Streamlit
+
+# Called first: the cached loads below already send elements (their spinner) to the page
+st.set_page_config(page_title='Courier View', layout="wide", initial_sidebar_state='expanded')
+
+# ----------------------
+# Load
+# ----------------------
+
+# Import dataset
+
+partitions = ensure_partitions('train.csv', 'partitions')
+df_sorted, offsets, id_lookup = load_courier_index(partitions, dataset_version(partitions))
+
+# ----------------------
+# Sidebar
+
+image_path = 'logo.png'
+image = Image.open(image_path)
+st.sidebar.image(image, width=300)
+
+st.sidebar.markdown( '# Food Delivery Company')
+st.sidebar.markdown("""---""")
+
+st.sidebar.markdown('# Courier')
+
+courier = st.sidebar.selectbox(
+    'Delivery person ID',
+    sorted(id_lookup['Delivery_person_ID'])
+)
+
+st.sidebar.markdown('# Filters')
+st.sidebar.markdown('## Select dates')
+
+date_slider = st.sidebar.slider(
+    'Time interval',
+    value=pd.datetime(2022, 4, 13),
+    min_value=pd.datetime(2022,2,11),
+    max_value=pd.datetime(2022,4,6),
+    format='DD-MM-YYYY'
+)
+
+st.sidebar.markdown('## Select traffic conditions')
+
+traffic_options = st.sidebar.multiselect(
+    'Traffic density',
+    ['Low', 'Medium', 'High', 'Jam'],
+    default=['Low', 'Medium', 'High', 'Jam']
+)
+
+st.sidebar.markdown('## Select the city type')
+
+city_options = st.sidebar.multiselect(
+    'City type',
+    ['Metropolitian','Urban','Semi-Urban'],
+    default=['Metropolitian','Urban','Semi-Urban']
+)
+
+st.sidebar.markdown("""---""")
+st.sidebar.markdown('##### Powered by [Caio Casagrande](https://www.linkedin.com/in/caiopc/)')
+
+# ----------------------
+# Adapting dataset to filters
+
+# Courier lookup, then date, traffic and city filters
+df = filter_orders(courier_orders(df_sorted, offsets, id_lookup, courier), date_slider, traffic_options, city_options)
+
+# ----------------------
+# Streamlit main page layout
+
+st.markdown('# Courier View')
+st.markdown("""---""")
+
+# First Section
+
+with st.container():
+    st.title(courier)
+
+    col1, col2, col3, col4 = st.columns(4, gap='large')
+
+    with col1:
+        col1.metric('Orders', len(df))
+
+    with col2:
+        col2.metric('Average rating', round(df['Delivery_person_Ratings'].mean(), 2))
+
+    with col3:
+        col3.metric('Average time', round(df['Time_taken(min)'].mean(), 2))
+
+    with col4:
+        col4.metric('Std. time', round(df['Time_taken(min)'].std(), 2))
+
+# Second Section
+
+st.markdown("""---""")
+
+with st.container():
+
+    col1, col2 = st.columns(2, gap='large')
+
+    with col1:
+        st.markdown('### Rating trend')
+
+        rating_trend(df)
+
+    with col2:
+        st.markdown('### Delivery time by city and traffic')
+
+        time_distribution(df)
+
+# Third Section
+
+st.markdown("""---""")
+
+with st.container():
+    st.markdown('### Orders')
+
+    # Both identifiers are displayed with their labels, not their int32 codes
+    st.dataframe(decode_ids(decode_ids(df, id_lookup, 'ID'), id_lookup, 'Delivery_person_ID'))
@@ -3,72 +3,26 @@
 # Libraries
 
 import pandas               as pd
-import numpy                as np
+import plotly.express       as px
 import plotly.graph_objects as go
 import streamlit            as st
 
 from PIL                    import  Image
+from food_data              import  ensure_partitions, load_filtered, load_id_lookup, read_snapshot, compute_metric
+from food_data              import  dataset_version
+from rolling_metrics        import  load_rolling_metrics
+from sidebar                import  export_sidebar
 
 # ----------------------
 # Functions
 # ----------------------
 
-def clean_code(df_raw):
-    """
-    The purpose of this function is cleaning the Dataframe
-
-    Types of cleaning:
-     1. Removal of 'NaN ' string data and its removal from Dataframe
-     2. Conversion of text columns to number
-     3. Conversion of text columns to datetime
-     4. Time_taken(min) column split and text to number conversion
-     5. Removing spaces inside strings/text/object
-    
-    Input: Dataframe
-    Output: Dataframe
-    """
-
-    # 1. Removal of 'NaN ' string data and its removal from Dataframe
-
-    df_clean = df_raw.replace('NaN ', np.nan).dropna()
-
-    # 2. Conversion of text columns to number
-
-    df_clean['Delivery_person_Age']         = df_clean['Delivery_person_Age'].astype(int)
-    df_clean['Delivery_person_Ratings']     = df_clean['Delivery_person_Ratings'].astype(float)
-    df_clean['multiple_deliveries']         = df_clean['multiple_deliveries'].astype(int)
-
-    # 3. Conversion of text columns to datetime
-
-    df_clean['Order_Date'] = pd.to_datetime(df_clean['Order_Date'], format = '%d-%m-%Y')
-
-    # 4. Time_taken(min) column split and text to number conversion
-    
-    df_clean['Time_taken(min)'] = df_clean['Time_taken(min)'].apply(lambda x: x.split('(min) ')[1])
-    df_clean['Time_taken(min)'] = df_clean['Time_taken(min)'].astype(int)
-    
-    # 5. Removing spaces inside strings/text/object
-
-    df_clean.loc[:, 'ID']                   = df_clean.loc[:, 'ID'].str.strip()
-    df_clean.loc[:, 'Road_traffic_density'] = df_clean.loc[:, 'Road_traffic_density'].str.strip()
-    df_clean.loc[:, 'Type_of_order']        = df_clean.loc[:, 'Type_of_order'].str.strip()
-    df_clean.loc[:, 'Type_of_vehicle']      = df_clean.loc[:, 'Type_of_vehicle'].str.strip()
-    df_clean.loc[:, 'City']                 = df_clean.loc[:, 'City'].str.strip()
-    df_clean.loc[:, 'Festival']             = df_clean.loc[:, 'Festival'].str.strip()
-  
-    return df_clean
-
-def rating_average_std(df, column):
+def rating_average_std(df, column, snapshot=None):
     """
     Description
     """
         
-    df_aux = (df[['Delivery_person_Ratings', column]]
-              .groupby([column])
-              .agg({'Delivery_person_Ratings': ['mean', 'std']}))
-        
-    df_aux.columns = ['avg_rating', 'std_rating']
-    df_aux = df_aux.reset_index()
+    df_aux = compute_metric('rating_stats', df, snapshot=snapshot, by=column)
 
     fig = go.Figure()
 
@@ -82,40 +36,50 @@ def rating_average_std(df, column):
 
     return fig
 
-def delivery_speed(df, boolean):
+def delivery_speed(df, boolean, id_lookup, snapshot=None):
     """
     Description
+
+    The groupby runs on the int32 courier codes and only the top 10 rows
+    of each city are translated back to their labels for display.
     """
     
-    df_aux = (df[['Delivery_person_ID', 'Time_taken(min)', 'City']]
-                        .groupby(['City', 'Delivery_person_ID']).mean()
-                        .sort_values(by=['City','Time_taken(min)'], ascending = boolean).reset_index())
-        
-    df_aux1 = df_aux.loc[df_aux['City'] == 'Metropolitian', :].head(10)
-    df_aux2 = df_aux.loc[df_aux['City'] == 'Urban', :].head(10)
-    df_aux3 = df_aux.loc[df_aux['City'] == 'Semi-Urban', :].head(10)
-    df_aux = pd.concat([df_aux1, df_aux2, df_aux3])
+    df_aux = compute_metric('courier_ranking', df, id_lookup, snapshot, order='fastest' if boolean else 'slowest')
         
     st.dataframe(df_aux)
 
     return df_aux
 
 
-# ----------------------
-# Load  
-# ----------------------
+def rating_trend(rolling_metrics, window, date_max, traffic, cities):
+    """
+    This function creates a line chart with the moving average of the rating in each city.
+    """
 
-# Import dataset
+    df_aux = rolling_metrics.rolling(window, cities, traffic, by='City', date_max=date_max)
+    fig = px.line(df_aux, x='Order_Date', y='avg_rating', color='City',
+                  labels={'Order_Date': 'Date', 'avg_rating': 'Average rating'})
 
-df_raw      = pd.read_csv('train.csv')
-df_clean    = clean_code(df_raw)
-df          = df_clean.copy()
+    st.plotly_chart(fig, use_container_width=True)
+
+    return fig
 
 # ----------------------
 # Streamlit
 
+# Called first: the cached loads below already send elements (their spinner) to the page
 st.set_page_config(page_title='Delivery View', layout="wide", initial_sidebar_state='expanded')
 
+# ----------------------
+# Load
+# ----------------------
+
+# Import dataset
+
+partitions = ensure_partitions('train.csv', 'partitions')
+rolling_metrics = load_rolling_metrics(partitions, dataset_version(partitions))
+id_lookup  = load_id_lookup(partitions, ['Delivery_person_ID'])
+
 # ----------------------
 # Sidebar
 
@@ -153,20 +117,19 @@ city_options = st.sidebar.multiselect(
     default=['Metropolitian','Urban','Semi-Urban']
 )
 
+export_sidebar(partitions, date_slider, traffic_options, city_options)
+
 st.sidebar.markdown("""---""")
 st.sidebar.markdown('##### Powered by [Caio Casagrande](https://www.linkedin.com/in/caiopc/)')
 
 # ----------------------
 # Adapting dataset to filters
 
-# Date filter
-df = df.loc[df['Order_Date'] <= date_slider, :]
-
-# Traffic filter
-df = df.loc[df['Road_traffic_density'].isin(traffic_options), :]
+# Precomputed metrics of the batch export, when it has this filter state
+snapshot = read_snapshot('snapshots', partitions, date_slider, traffic_options, city_options)
 
-# City Filter
-df=df.loc[df['City'].isin(city_options),:]
+# Partition pruning by date and city, then date, traffic and city filters
+df = load_filtered(partitions, date_slider, traffic_options, city_options) if snapshot is None else None
 
 # ----------------------
 # Streamlit main page layout
@@ -179,26 +142,28 @@ st.markdown("""---""")
 with st.container():
     st.title('General Information')
 
+    summary = compute_metric('deliverymen_summary', df, snapshot=snapshot)
+
     col1, col2, col3, col4 = st.columns(4, gap='large')
 
     with col1:
         # st.subheader('Coluna 1')
-        oldest_deliveryman = df['Delivery_person_Age'].max()
+        oldest_deliveryman = summary['oldest_deliveryman']
         col1.metric('Oldest Deliveryman', oldest_deliveryman)
 
     with col2:
         # st.subheader('Coluna 2')
-        youngest_deliveryman = df['Delivery_person_Age'].min()
+        youngest_deliveryman = summary['youngest_deliveryman']
         col2.metric('Youngest Deliveryman', youngest_deliveryman)
 
     with col3:
         # st.subheader('Coluna 3')
-        best_condition = df['Vehicle_condition'].max()
+        best_condition = summary['best_condition']
         col3.metric('Best Vehicle Condition', best_condition)
 
     with col4:
         # st.subheader('Coluna 4')
-        worst_condition = df['Vehicle_condition'].min()
+        worst_condition = summary['worst_condition']
         col4.metric('Worst Vehicle Condition', worst_condition)
 
 # Second Section
@@ -222,20 +187,20 @@ with st.container():
     with col1:
         st.markdown('### By vehicle condition')
         
-        rating_average_std(df, 'Vehicle_condition')
+        rating_average_std(df, 'Vehicle_condition', snapshot)
 
         st.markdown('### By type of order')
 
-        rating_average_std(df, 'Type_of_order')
+        rating_average_std(df, 'Type_of_order', snapshot)
 
     with col2:
         st.markdown('### By traffic density')
         
-        rating_average_std(df, 'Road_traffic_density')
+        rating_average_std(df, 'Road_traffic_density', snapshot)
 
         st.markdown('### By weather condition')
         
-        rating_average_std(df, 'Weatherconditions')
+        rating_average_std(df, 'Weatherconditions', snapshot)
     
 
 # Third Section
@@ -252,12 +217,26 @@ with st.container():
         st.subheader('Fastest Delivery Person')
         st.markdown('##### on average by city')
 
-        delivery_speed(df, True)
+        delivery_speed(df, True, id_lookup, snapshot)
 
     
      with col2:
         st.subheader('Slowest Delivery Person')
         st.markdown('##### on average by city ')
 
-        delivery_speed(df, False)
+        delivery_speed(df, False, id_lookup, snapshot)
+
+# Fourth Section
+
+st.markdown("""---""")
+
+with st.container():
+
+    st.title('Rating Trend')
+    st.markdown('##### moving average by city')
+
+    window = st.radio('Moving average window', [7, 28], format_func=lambda days: f'{days} days',
+                      horizontal=True, key='rating_window')
+
+    rating_trend(rolling_metrics, window, date_slider, traffic_options, city_options)
         
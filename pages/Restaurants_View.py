@@ -8,85 +8,37 @@ import plotly.express       as px
 import plotly.graph_objects as go
 import streamlit            as st
 import folium
-import haversine 
 
 from PIL                    import  Image
-from haversine              import  haversine
+from food_data              import  ensure_partitions, load_filtered, read_snapshot, compute_metric
+from food_data              import  dataset_version
+from rolling_metrics        import  load_rolling_metrics
+from sidebar                import  export_sidebar
 from streamlit_folium       import  folium_static
 
 # ----------------------
 # Functions
 # ----------------------
 
-def clean_code(df_raw):
-    """
-    The purpose of this function is cleaning the Dataframe
-
-    Types of cleaning:
-     1. Removal of 'NaN ' string data and its removal from Dataframe
-     2. Conversion of text columns to number
-     3. Conversion of text columns to datetime
-     4. Time_taken(min) column split and text to number conversion
-     5. Removing spaces inside strings/text/object
-    
-    Input: Dataframe
-    Output: Dataframe
-    """
-
-    # 1. Removal of 'NaN ' string data and its removal from Dataframe
-
-    df_clean = df_raw.replace('NaN ', np.nan).dropna()
-
-    # 2. Conversion of text columns to number
-
-    df_clean['Delivery_person_Age']         = df_clean['Delivery_person_Age'].astype(int)
-    df_clean['Delivery_person_Ratings']     = df_clean['Delivery_person_Ratings'].astype(float)
-    df_clean['multiple_deliveries']         = df_clean['multiple_deliveries'].astype(int)
-
-    # 3. Conversion of text columns to datetime
-
-    df_clean['Order_Date'] = pd.to_datetime(df_clean['Order_Date'], format = '%d-%m-%Y')
-
-    # 4. Time_taken(min) column split and text to number conversion
-    
-    df_clean['Time_taken(min)'] = df_clean['Time_taken(min)'].apply(lambda x: x.split('(min) ')[1])
-    df_clean['Time_taken(min)'] = df_clean['Time_taken(min)'].astype(int)
-    
-    # 5. Removing spaces inside strings/text/object
-
-    df_clean.loc[:, 'ID']                   = df_clean.loc[:, 'ID'].str.strip()
-    df_clean.loc[:, 'Road_traffic_density'] = df_clean.loc[:, 'Road_traffic_density'].str.strip()
-    df_clean.loc[:, 'Type_of_order']        = df_clean.loc[:, 'Type_of_order'].str.strip()
-    df_clean.loc[:, 'Type_of_vehicle']      = df_clean.loc[:, 'Type_of_vehicle'].str.strip()
-    df_clean.loc[:, 'City']                 = df_clean.loc[:, 'City'].str.strip()
-    df_clean.loc[:, 'Festival']             = df_clean.loc[:, 'Festival'].str.strip()
-  
-    return df_clean
-
-def time(df, decision, parameter):
+def time(df, decision, parameter, snapshot=None):
     """
     Description.
 
     decision = 'Yes' or 'No'
     parameter = 'avg_time' or 'std_time'
     """
-    df_aux = df[['Time_taken(min)', 'Festival']].groupby(['Festival']).agg({'Time_taken(min)': ['mean', 'std']})
-    df_aux.columns = ['avg_time', 'std_time']
-    df_aux = np.round(df_aux.reset_index(), 2)
+    df_aux = np.round(compute_metric('time_stats', df, snapshot=snapshot, by='Festival'), 2)
     results = df_aux.loc[df_aux['Festival'] == decision, parameter]
 
     return results
 
-def distance(df):
+def distance(df, snapshot=None):
     """
     This function generates a distance result between the restaurantes 
     and the delivery location point and then display a bar chart with the average result.
     """
 
-    df['distance'] = (df.apply( lambda x: haversine((x['Restaurant_latitude'], x['Restaurant_longitude'] ), 
-                                                    (x['Delivery_location_latitude'], x['Delivery_location_longitude'])), axis=1))
-    avg_distance = (df.loc[:, ['City', 'distance']]
-                    .groupby(['City']).mean().reset_index())
+    avg_distance = compute_metric('distance_by_city', df, snapshot=snapshot)
         
     fig = go.Figure()
     fig.add_trace(go.Bar(x = avg_distance['City'],
@@ -98,14 +50,12 @@ def distance(df):
 
     return fig
 
-def time_taken(df):
+def time_taken(df, snapshot=None):
     """
     This function generates a bar chart for the average and std time taken for each type of city.
     """
 
-    df_aux = df[['Time_taken(min)', 'City']].groupby(['City']).agg({'Time_taken(min)': ['mean', 'std']})
-    df_aux.columns = ['avg_time', 'std_time']
-    df_aux = df_aux.reset_index()  
+    df_aux = compute_metric('time_stats', df, snapshot=snapshot, by='City')
 
     fig = go.Figure()
     fig.add_trace(go.Bar(name = 'Control',
@@ -120,32 +70,22 @@ def time_taken(df):
     
     return fig
 
-def time_city_order(df):
+def time_city_order(df, snapshot=None):
     """
     This function generates a dataframe with the time taken for each type of order for each type of city.
     """
-    df_aux = (df[['City', 'Time_taken(min)', 'Type_of_order']]
-              .groupby(['City', 'Type_of_order'])
-              .agg({'Time_taken(min)': ['mean', 'std']}))
-    
-    df_aux.columns = ['avg_time', 'std_time']
-    df_aux = df_aux.reset_index()
+    df_aux = compute_metric('time_stats', df, snapshot=snapshot, by='City,Type_of_order')
 
     st.dataframe(df_aux)
     
     return df_aux
 
-def sunburst_chart(df):
+def sunburst_chart(df, snapshot=None):
     """
     This function creates a sunburst chart for the time taken.
     """
 
-    df_aux = (df[['City', 'Time_taken(min)', 'Road_traffic_density']]
-              .groupby(['City', 'Road_traffic_density'])
-              .agg({'Time_taken(min)': ['mean', 'std']}))
-    
-    df_aux.columns = ['avg_time', 'std_time']
-    df_aux = df_aux.reset_index()
+    df_aux = compute_metric('time_stats', df, snapshot=snapshot, by='City,Road_traffic_density')
 
     fig = px.sunburst(df_aux, path=['City', 'Road_traffic_density'], values = 'avg_time', 
                       color = 'std_time', color_continuous_scale='RdBu', 
@@ -157,21 +97,34 @@ def sunburst_chart(df):
     
     return fig
 
-# ----------------------
-# Load 
-# ----------------------
+def time_trend(rolling_metrics, window, date_max, traffic, cities):
+    """
+    This function creates a line chart with the moving average of the time taken in each city.
+    """
 
-# Import dataset
+    df_aux = rolling_metrics.rolling(window, cities, traffic, by='City', date_max=date_max)
+    fig = px.line(df_aux, x='Order_Date', y='avg_time', color='City',
+                  labels={'Order_Date': 'Date', 'avg_time': 'Average time (min)'})
+
+    st.plotly_chart(fig, use_container_width=True)
 
-df_raw      = pd.read_csv('train.csv')
-df_clean    = clean_code(df_raw)
-df          = df_clean.copy()
+    return fig
 
 # ----------------------
 # Streamlit
 
+# Called first: the cached loads below already send elements (their spinner) to the page
 st.set_page_config(page_title='Restaurants View', layout="wide", initial_sidebar_state='expanded')
 
+# ----------------------
+# Load
+# ----------------------
+
+# Import dataset
+
+partitions = ensure_partitions('train.csv', 'partitions')
+rolling_metrics = load_rolling_metrics(partitions, dataset_version(partitions))
+
 # ----------------------
 # Sidebar
 
@@ -209,20 +162,19 @@ city_options = st.sidebar.multiselect(
     default=['Metropolitian','Urban','Semi-Urban']
 )
 
+export_sidebar(partitions, date_slider, traffic_options, city_options)
+
 st.sidebar.markdown("""---""")
 st.sidebar.markdown('##### Powered by [Caio Casagrande](https://www.linkedin.com/in/caiopc/)')
 
 # ----------------------
 # Adapting dataset to filters
 
-# Date filter
-df = df.loc[df['Order_Date'] <= date_slider, :]
-
-# Traffic filter
-df = df.loc[df['Road_traffic_density'].isin(traffic_options), :]
+# Precomputed metrics of the batch export, when it has this filter state
+snapshot = read_snapshot('snapshots', partitions, date_slider, traffic_options, city_options)
 
-# City Filter
-df=df.loc[df['City'].isin(city_options),:]
+# Partition pruning by date and city, then date, traffic and city filters
+df = load_filtered(partitions, date_slider, traffic_options, city_options) if snapshot is None else None
 
 # ----------------------
 # Streamlit main page layout
@@ -235,23 +187,23 @@ with st.container():
     col1, col2, col3, col4, col5 = st.columns(5)
     
     with col1:
-        number_deliverymen = len(df['Delivery_person_ID'].unique())
+        number_deliverymen = compute_metric('deliverymen_summary', df, snapshot=snapshot)['deliverymen']
         col1.metric('Number of deliverymen', number_deliverymen)
 
     with col2:
-        results = time(df, 'No', 'avg_time')
+        results = time(df, 'No', 'avg_time', snapshot)
         col2.metric('Usual average time', results)
 
     with col3:
-        results = time(df, 'No', 'std_time')
+        results = time(df, 'No', 'std_time', snapshot)
         col3.metric('Usual std. time', results)
 
     with col4:
-        results = time(df, 'Yes', 'avg_time')
+        results = time(df, 'Yes', 'avg_time', snapshot)
         col4.metric('Average time during festival', results)
 
     with col5:
-        results = time(df, 'Yes', 'std_time')
+        results = time(df, 'Yes', 'std_time', snapshot)
         col5.metric('Std. time during festival', results)
 
 with st.container():
@@ -263,13 +215,13 @@ with st.container():
         st.markdown('### Average distance by city (km)')
         st.write('The average distance is measured between the restaurants and the delivery points.')
         
-        distance(df)
+        distance(df, snapshot)
     
     with col2:
         st.markdown('### Time delivery by city (min)')
         st.write('The chart displays the average time taken for the deliveries with the standard deviation indicator at the top of each bar.')
         
-        time_taken(df)
+        time_taken(df, snapshot)
 
 with st.container():
     st.markdown("""---""")
@@ -279,13 +231,23 @@ with st.container():
     with col1:
         st.markdown('### Average time and standard deviation by city and type of order')
         
-        time_city_order(df)
+        time_city_order(df, snapshot)
 
 
     with col2:
         st.markdown('### Delivery time by city and traffic')
         st.write('The average time are displayed as the values and the standard deviation as the colors.')
         
-        sunburst_chart(df)
+        sunburst_chart(df, snapshot)
+
+with st.container():
+    st.markdown("""---""")
+
+    st.markdown('### Moving average of the delivery time by city (min)')
+
+    window = st.radio('Moving average window', [7, 28], format_func=lambda days: f'{days} days',
+                      horizontal=True, key='time_window')
+
+    time_trend(rolling_metrics, window, date_slider, traffic_options, city_options)
         
 
@@ -0,0 +1,210 @@
+# Rolling Metrics
+
+# Moving averages of the order volume, the delivery time and the rating,
+# maintained incrementally from daily totals per city and traffic density.
+#
+# The dashboard pages build them once per dataset version with load_rolling_metrics.
+# The partitions are rebuilt from the whole train.csv when it changes, so the pages
+# rebuild the rolling metrics as well: ingest is meant for an append-only feed of new
+# days, which the dashboard does not have.
+
+# Importing libraries
+
+import pandas               as pd
+import numpy                as np
+import streamlit            as st
+
+from food_data              import  load_partitions, TRAFFIC_OPTIONS, CITY_OPTIONS
+
+# ----------------------
+# Settings
+# ----------------------
+
+# Daily totals kept for each city and traffic density
+MEASURES = ['orders', 'time_taken', 'rating']
+
+# Columns of the partitions read to build the daily totals
+COLUMNS = ['Order_Date', 'City', 'Road_traffic_density', 'Time_taken(min)', 'Delivery_person_Ratings']
+
+# ----------------------
+# Rolling metrics
+# ----------------------
+
+class RollingMetrics:
+    """
+    Prefix sums over the days of the daily totals of MEASURES per City x
+    Road_traffic_density, stored in an array that doubles its capacity when full.
+
+    The total of any window of days is the difference of two prefix rows, so the
+    moving averages of a whole history cost O(days) for any window and filter,
+    and ingesting the orders of a new day costs O(1) (amortized).
+    """
+
+    def __init__(self, start_date, cities=CITY_OPTIONS, traffic=TRAFFIC_OPTIONS, capacity=64):
+        # Without orders yet, the first ingested day becomes the start date
+        self.start_date = None if start_date is None else pd.Timestamp(start_date).normalize()
+        self.cities = list(cities)
+        self.traffic = list(traffic)
+        self.size = 0
+        self.prefix = np.zeros((capacity + 1, len(self.cities), len(self.traffic), len(MEASURES)))
+
+    @classmethod
+    def from_orders(cls, df):
+        """
+        This function builds the prefix sums of a whole history at once.
+
+        Input: Dataframe of orders
+        Output: RollingMetrics
+        """
+
+        if df.empty:
+            return cls(None)
+
+        start_date = df['Order_Date'].min().normalize()
+        days = (df['Order_Date'].dt.normalize() - start_date).dt.days.to_numpy()
+
+        rolling_metrics = cls(start_date, capacity=days.max() + 1)
+        totals = rolling_metrics.daily_totals(df, days, days.max() + 1)
+
+        np.cumsum(totals, axis=0, out=rolling_metrics.prefix[1:])
+        rolling_metrics.size = days.max() + 1
+
+        return rolling_metrics
+
+    @classmethod
+    def load(cls, directory='partitions'):
+        """
+        This function builds the prefix sums of the whole partitioned dataset,
+        reading only the columns of the daily totals.
+
+        Input: partition directory
+        Output: RollingMetrics
+        """
+
+        return cls.from_orders(load_partitions(directory, columns=COLUMNS))
+
+    def daily_totals(self, df, days, n_days):
+        """
+        This function sums MEASURES by day, city and traffic density.
+
+        Input: Dataframe of orders, day index of each order, number of days
+        Output: numpy array (days, cities, traffic densities, measures)
+        """
+
+        city = pd.Categorical(df['City'], categories=self.cities).codes
+        traffic = pd.Categorical(df['Road_traffic_density'], categories=self.traffic).codes
+        known = (city >= 0) & (traffic >= 0)
+
+        values = np.column_stack([np.ones(len(df)),
+                                  df['Time_taken(min)'].to_numpy(np.float64),
+                                  df['Delivery_person_Ratings'].to_numpy(np.float64)])
+
+        totals = np.zeros((n_days, len(self.cities), len(self.traffic), len(MEASURES)))
+        np.add.at(totals, (days[known], city[known], traffic[known]), values[known])
+
+        return totals
+
+    def ingest(self, df):
+        """
+        This function adds the orders of new days, or more orders of the last day.
+        Days without orders in between are added with zero totals.
+
+        Input: Dataframe of orders, none of them before the last ingested day
+        Output: None
+        """
+
+        if df.empty:
+            return None
+
+        if self.start_date is None:
+            self.start_date = df['Order_Date'].min().normalize()
+
+        days = (df['Order_Date'].dt.normalize() - self.start_date).dt.days.to_numpy()
+        first_day, last_day = days.min(), days.max()
+
+        if first_day < self.size - 1 or first_day < 0:
+            raise ValueError('orders before the last ingested day need a rebuild with from_orders')
+
+        totals = self.daily_totals(df, days - first_day, last_day - first_day + 1)
+
+        while last_day + 2 > len(self.prefix):
+            self.prefix = np.concatenate([self.prefix, np.zeros_like(self.prefix)])
+
+        # Orders of the last ingested day are added to the totals it already has
+        if first_day == self.size - 1:
+            totals[0] += self.prefix[self.size] - self.prefix[self.size - 1]
+
+        # The days between the last ingested day and the new ones have no orders
+        self.prefix[self.size + 1:first_day + 1] = self.prefix[self.size]
+        self.prefix[first_day + 1:last_day + 2] = self.prefix[first_day] + np.cumsum(totals, axis=0)
+
+        self.size = last_day + 1
+
+        return None
+
+    def rolling(self, window, cities=None, traffic=None, by=None, date_max=None):
+        """
+        This function computes the moving averages over the last window days of each
+        day: daily orders, average delivery time and average rating. The first days
+        average over the days available.
+
+        Input: window in days, list of cities, list of traffic densities,
+               None, 'City' or 'Road_traffic_density', last date
+        Output: Dataframe with the columns Order_Date, by (if any), orders, avg_time and avg_rating
+        """
+
+        if self.size == 0:
+            return pd.DataFrame(columns=['Order_Date'] + ([] if by is None else [by]) + ['orders', 'avg_time', 'avg_rating'])
+
+        city_index = [self.cities.index(city) for city in (self.cities if cities is None else cities)]
+        traffic_index = [self.traffic.index(option) for option in (self.traffic if traffic is None else traffic)]
+
+        prefix = self.prefix[:self.size + 1][:, city_index][:, :, traffic_index]
+
+        if by == 'City':
+            prefix, groups = prefix.sum(axis=2), [self.cities[i] for i in city_index]
+        elif by == 'Road_traffic_density':
+            prefix, groups = prefix.sum(axis=1), [self.traffic[i] for i in traffic_index]
+        else:
+            prefix, groups = prefix.sum(axis=(1, 2))[:, np.newaxis], [None]
+
+        ends = np.arange(1, self.size + 1)
+        starts = np.maximum(ends - window, 0)
+        totals = prefix[ends] - prefix[starts]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            orders = totals[..., 0] / (ends - starts)[:, np.newaxis]
+            avg_time = totals[..., 1] / totals[..., 0]
+            avg_rating = totals[..., 2] / totals[..., 0]
+
+        dates = self.start_date + pd.to_timedelta(np.arange(self.size), unit='D')
+
+        df_aux = pd.DataFrame({'Order_Date':  np.repeat(dates, len(groups)),
+                               'group':       np.tile(groups, self.size),
+                               'orders':      orders.ravel(),
+                               'avg_time':    avg_time.ravel(),
+                               'avg_rating':  avg_rating.ravel()})
+
+        if date_max is not None:
+            df_aux = df_aux.loc[df_aux['Order_Date'] <= pd.Timestamp(date_max), :]
+
+        if by is None:
+            return df_aux.drop(columns='group').reset_index(drop=True)
+
+        return df_aux.rename(columns={'group': by}).reset_index(drop=True)
+
+# ----------------------
+# Dashboard
+# ----------------------
+
+@st.experimental_singleton
+def load_rolling_metrics(directory, version):
+    """
+    This function builds the rolling metrics of the whole dataset only once
+    for each dataset version, sharing them between reruns and sessions.
+
+    Input: partition directory, dataset version
+    Output: RollingMetrics
+    """
+
+    return RollingMetrics.load(directory)
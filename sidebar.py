@@ -0,0 +1,49 @@
+# Sidebar
+
+# Sidebar sections shared by the dashboard pages
+
+# Importing libraries
+
+import streamlit            as st
+
+from food_data              import  dataset_columns, export_url, EXPORT_API_URL
+
+# ----------------------
+# Functions
+# ----------------------
+
+def export_sidebar(partitions, date_max, traffic, cities):
+    """
+    This function adds the export of the filtered orders to the sidebar: the file
+    format, the columns and a link to the export streamed by the API (api.py).
+
+    The section is shown only when FOOD_API_URL gives the address of a running API.
+
+    Input: partition directory, last date, list of traffic densities, list of cities
+    Output: None
+    """
+
+    if EXPORT_API_URL is None:
+        return None
+
+    st.sidebar.markdown('## Export the filtered orders')
+
+    export_format = st.sidebar.selectbox(
+        'File format',
+        ['csv', 'parquet']
+    )
+
+    columns = dataset_columns(partitions)
+
+    export_columns = st.sidebar.multiselect(
+        'Columns',
+        columns,
+        default=columns
+    )
+
+    if export_columns:
+        st.sidebar.markdown(f'[Download the orders]({export_url(export_format, export_columns, date_max, traffic, cities)})')
+    else:
+        st.sidebar.markdown('Select at least one column to export.')
+
+    return None